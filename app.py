@@ -5,11 +5,16 @@ LangGraphを使用したGeminiとChatGPTを統合したチャットアプリ
 """
 import streamlit as st
 import os
+import queue
+import threading
+import uuid
 from typing import List, Dict, Any, Optional
 
 from graph.builder import build_graph, run_graph
-from utils.helpers import format_messages_for_display, save_conversation_history, load_conversation_history
-from config import APP_TITLE, APP_DESCRIPTION, OPENAI_API_KEY, GOOGLE_API_KEY
+from utils.helpers import format_messages_for_display, save_conversation_history, load_conversation_history, determine_next_model
+from utils.cancellation import new_cancel_token, cancel_session
+from utils.blob_store import intern_text
+from config import APP_TITLE, APP_DESCRIPTION, OPENAI_API_KEY, GOOGLE_API_KEY, UI_POLL_INTERVAL, get_runtime_config
 
 
 def initialize_session_state():
@@ -24,6 +29,10 @@ def initialize_session_state():
         st.session_state.chat_history = []
     if "graph" not in st.session_state:
         st.session_state.graph = build_graph()
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if "model_params" not in st.session_state:
+        st.session_state.model_params = {}
 
 
 def display_chat_history():
@@ -59,31 +68,87 @@ def process_user_message(user_input: str):
         message_placeholder = st.empty()
         message_placeholder.markdown("🤔 考え中...")
         
+        # 新しいトークンを発行すると、同じセッションで実行中の生成はキャンセルされる
+        cancel_token = new_cancel_token(st.session_state.session_id)
+        completed = False
+        
+        # グラフは別スレッドで実行し、このスレッドは表示の更新だけを行う。
+        # Streamlitの再実行（停止ボタンなど）は st.* の呼び出し時にしか割り込めないため、
+        # プロバイダーが応答を止めていても一定間隔で表示を更新して割り込めるようにする
+        # （別スレッドからは st.session_state を参照できないため、引数はここで取り出しておく）
+        updates: "queue.Queue[Optional[str]]" = queue.Queue()
+        outcome: Dict[str, Any] = {}
+        graph = st.session_state.graph
+        messages = list(st.session_state.messages)  # 履歴はコピーを渡し、完了時にのみ反映する
+        system_message = st.session_state.system_message
+        current_model = st.session_state.current_model
+        model_params = st.session_state.model_params
+        session_id = st.session_state.session_id
+
+        def run_in_background():
+            try:
+                outcome["result"] = run_graph(
+                    graph,
+                    user_input,
+                    messages,
+                    system_message,
+                    current_model,
+                    cancel_token=cancel_token,
+                    on_chunk=updates.put,
+                    model_params=model_params,
+                    session_id=session_id,
+                )
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                updates.put(None)
+
         try:
-            # グラフを実行
-            result = run_graph(
-                st.session_state.graph,
-                user_input,
-                st.session_state.messages,
-                st.session_state.system_message,
-                st.session_state.current_model,
-            )
+            threading.Thread(target=run_in_background, daemon=True).start()
+
+            partial = None
+            while True:
+                try:
+                    update = updates.get(timeout=UI_POLL_INTERVAL)
+                    if update is None:
+                        break
+                    partial = update
+                except queue.Empty:
+                    pass
+                message_placeholder.markdown(partial + "▌" if partial is not None else "🤔 考え中...")
+
+            if "error" in outcome:
+                raise outcome["error"]
+            result = outcome["result"]
+            completed = True
             
             # 結果を保存
             st.session_state.messages = result["messages"]
             st.session_state.current_model = result["current_model"]
             response = result["response"]
             
-            # アシスタントメッセージを表示
-            message_placeholder.markdown(response)
-            
             # チャット履歴に追加
-            st.session_state.chat_history.append({"is_user": False, "content": response})
+            if response or not result["cancelled"]:
+                st.session_state.chat_history.append({"is_user": False, "content": response})
+            
+            # アシスタントメッセージを表示
+            message_placeholder.markdown(response + (" ⏹️" if result["cancelled"] else ""))
             
         except Exception as e:
+            completed = True
             error_message = f"エラーが発生しました: {str(e)}"
             message_placeholder.markdown(f"❌ {error_message}")
             st.error(error_message)
+        finally:
+            if not completed:
+                # 停止ボタンや新しいメッセージによる再実行で中断された場合、
+                # 別スレッドのグラフをキャンセルし、途中までの応答だけを残す
+                cancel_token.cancel()
+                st.session_state.messages = st.session_state.messages + [{"role": "user", "content": user_input}]
+                if cancel_token.partial_response:
+                    st.session_state.messages.append({"role": "assistant", "content": cancel_token.partial_response})
+                    st.session_state.chat_history.append({"is_user": False, "content": cancel_token.partial_response})
+                st.session_state.current_model = determine_next_model({"current_model": st.session_state.current_model})
 
 
 def check_api_keys() -> bool:
@@ -143,7 +208,8 @@ def main():
         )
         
         if system_message != st.session_state.system_message:
-            st.session_state.system_message = system_message
+            # 同じシステムメッセージはセッション間で1つの文字列を共有する
+            st.session_state.system_message = intern_text(system_message)
         
         # 使用するモデルを選択
         model_choice = st.radio(
@@ -156,10 +222,41 @@ def main():
            (model_choice == "Gemini" and st.session_state.current_model != "gemini"):
             st.session_state.current_model = "chatgpt" if model_choice == "ChatGPT" else "gemini"
         
+        # モデルパラメータ（上書きしない場合は設定ファイルの変更がそのまま反映される）
+        runtime_config = get_runtime_config()
+        with st.expander("モデルパラメータ"):
+            override = st.checkbox(
+                "このセッションで上書きする",
+                value=bool(st.session_state.model_params),
+            )
+            if override:
+                params = runtime_config.with_overrides(st.session_state.model_params)
+                st.session_state.model_params = {
+                    "openai_model": st.text_input("OpenAI モデル", value=params.openai_model),
+                    "gemini_model": st.text_input("Gemini モデル", value=params.gemini_model),
+                    "temperature": st.slider("temperature", 0.0, 2.0, value=params.temperature, step=0.1),
+                    "max_tokens": int(st.number_input("max_tokens", 1, 32768, value=params.max_tokens, step=64)),
+                }
+            else:
+                st.session_state.model_params = {}
+                st.caption(
+                    f"OpenAI: {runtime_config.openai_model} / Gemini: {runtime_config.gemini_model} / "
+                    f"temperature: {runtime_config.temperature} / max_tokens: {runtime_config.max_tokens}"
+                )
+        
         st.divider()
         
+        # 実行中の生成を停止（途中までの応答は履歴に残る）
+        st.button(
+            "生成を停止",
+            on_click=cancel_session,
+            args=(st.session_state.session_id,),
+            use_container_width=True,
+        )
+        
         # 会話のリセット
         if st.button("会話をリセット", use_container_width=True):
+            cancel_session(st.session_state.session_id)
             st.session_state.messages = []
             st.session_state.chat_history = []
             st.rerun()
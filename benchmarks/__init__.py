@@ -0,0 +1 @@
+# ベンチマークモジュール初期化ファイル
@@ -0,0 +1,136 @@
+"""
+ブロブストアによる重複排除のベンチマーク
+
+合成した会話セッション群を、従来のJSON形式と参照形式で保存・読み込みし、
+ディスク使用量とメモリ使用量を比較する
+
+使用例:
+    python -m benchmarks.bench_blob_store --sessions 10000
+"""
+from typing import Dict, List, Any
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from utils.blob_store import BlobStore, dehydrate_state, hydrate_state
+
+
+def make_corpus(num_sessions: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    合成セッションを生成
+
+    少数の長いシステムメッセージと、定型的な長い本文（貼り付けられた資料など）を
+    多数のセッションで使い回す
+
+    引数:
+        num_sessions (int): セッション数
+        seed (int): 乱数シード
+
+    戻り値:
+        List[Dict[str, Any]]: グラフ状態のリスト
+    """
+    rng = random.Random(seed)
+    system_messages = [
+        f"あなたは有能なアシスタントです（版 {i}）。" + "回答は丁寧かつ簡潔に。" * 200
+        for i in range(5)
+    ]
+    pasted_documents = [f"参考資料 {i}\n" + "仕様の詳細説明。" * 400 for i in range(20)]
+
+    corpus = []
+    for session in range(num_sessions):
+        messages = []
+        for turn in range(rng.randint(2, 8)):
+            if rng.random() < 0.3:
+                user_content = rng.choice(pasted_documents)
+            else:
+                user_content = f"質問 {session}-{turn}"
+            messages.append({"role": "user", "content": user_content})
+            messages.append({"role": "assistant", "content": f"回答 {session}-{turn} " + "説明" * rng.randint(5, 50)})
+        corpus.append({
+            "messages": messages,
+            "system_message": rng.choice(system_messages),
+            "current_model": "chatgpt",
+        })
+    return corpus
+
+
+def directory_size(path: str) -> int:
+    """ディレクトリ内のファイルサイズの合計"""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def measure_load(paths: List[str], load) -> Dict[str, float]:
+    """ファイル群を読み込み、時間と保持メモリを計測"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    states = [load(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del states
+    return {"seconds": elapsed, "bytes": current}
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="ブロブストアによる重複排除のベンチマーク")
+    parser.add_argument("--sessions", type=int, default=10_000, help="セッション数")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.sessions)
+    root = tempfile.mkdtemp(prefix="bench_blob_store_")
+
+    try:
+        plain_dir = os.path.join(root, "plain")
+        ref_dir = os.path.join(root, "ref")
+        blob_dir = os.path.join(root, "blobs")
+        os.makedirs(plain_dir)
+        os.makedirs(ref_dir)
+        store = BlobStore(blob_dir)
+
+        plain_paths, ref_paths = [], []
+        for i, state in enumerate(corpus):
+            plain_path = os.path.join(plain_dir, f"{i}.json")
+            with open(plain_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            plain_paths.append(plain_path)
+
+            ref_path = os.path.join(ref_dir, f"{i}.json")
+            with open(ref_path, "w", encoding="utf-8") as f:
+                json.dump(dehydrate_state(state, store), f, ensure_ascii=False)
+            ref_paths.append(ref_path)
+        del corpus
+
+        plain_size = directory_size(plain_dir)
+        ref_size = directory_size(ref_dir) + directory_size(blob_dir)
+        print(f"ディスク: 従来 {plain_size / 2**20:.1f} MiB / 参照形式 {ref_size / 2**20:.1f} MiB "
+              f"（ブロブ含む、{100 * (1 - ref_size / plain_size):.1f}% 削減）")
+
+        def load_plain(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        def load_ref(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return hydrate_state(json.load(f), store)
+
+        plain = measure_load(plain_paths, load_plain)
+        ref = measure_load(ref_paths, load_ref)
+        print(f"メモリ: 従来 {plain['bytes'] / 2**20:.1f} MiB / 参照形式 {ref['bytes'] / 2**20:.1f} MiB "
+              f"（{100 * (1 - ref['bytes'] / plain['bytes']):.1f}% 削減）")
+        print(f"読み込み: 従来 {plain['seconds']:.2f} 秒 / 参照形式 {ref['seconds']:.2f} 秒")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+会話履歴の一括エクスポートのベンチマーク
+
+合成した会話を、従来のJSON形式（セッションごとのファイル）と列指向形式で保存・読み込みし、
+書き込み時間、ディスク使用量、全件の読み込み時間、条件付き集計の時間を比較する
+
+使用例:
+    python -m benchmarks.bench_export --messages 1000000
+    python -m benchmarks.bench_export --messages 1000000 --formats parquet msgpack
+"""
+from typing import Dict, List, Any, Iterator, Tuple
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_blob_store import directory_size
+from utils.blob_store import BlobStore
+from utils.conversation_export import export_conversations, iter_conversations, read_batches
+from utils.helpers import save_conversation_history, load_conversation_history
+from config import BLOB_STORE_ENABLED
+
+
+MODELS = ["gpt-4o", "gemini-pro"]
+
+
+def make_sessions(num_messages: int, messages_per_session: int, seed: int = 0) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    合成セッションを順に生成
+
+    ユーザーとアシスタントが交互に発言し、アシスタントメッセージにはモデル名・レイテンシ・トークン数を付ける
+
+    引数:
+        num_messages (int): メッセージの総数
+        messages_per_session (int): 1セッションあたりのメッセージ数
+        seed (int): 乱数シード
+
+    戻り値:
+        Iterator[Tuple[str, List[Dict[str, Any]]]]: (セッションID, メッセージのリスト)
+    """
+    rng = random.Random(seed)
+    for session in range((num_messages + messages_per_session - 1) // messages_per_session):
+        count = min(messages_per_session, num_messages - session * messages_per_session)
+        messages = []
+        for i in range(count):
+            if i % 2 == 0:
+                messages.append({"role": "user", "content": f"質問 {session}-{i} " + "詳細" * rng.randint(5, 60)})
+            else:
+                input_tokens = rng.randint(50, 4000)
+                output_tokens = rng.randint(20, 800)
+                messages.append({
+                    "role": "assistant",
+                    "content": f"回答 {session}-{i} " + "説明" * rng.randint(20, 200),
+                    "model": MODELS[(i // 2) % 2],
+                    "latency": round(rng.lognormvariate(0.0, 0.6), 6),
+                    "usage": {
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                })
+        yield f"session-{session:07d}", messages
+
+
+def bench_json(root: str, args) -> Dict[str, float]:
+    """従来のJSON形式（セッションごとのファイル、BLOB_STORE_ENABLED が有効な場合は長い本文をブロブストアに保存）"""
+    directory = os.path.join(root, "json")
+    os.makedirs(directory)
+    # 作業ディレクトリのブロブストアに書き込まないよう、有効な場合も一時的なストアを使用する
+    store = BlobStore(os.path.join(root, "json_blobs")) if BLOB_STORE_ENABLED else None
+
+    start = time.perf_counter()
+    paths = []
+    for session_id, messages in make_sessions(args.messages, args.messages_per_session):
+        path = os.path.join(directory, f"{session_id}.json")
+        save_conversation_history(messages, path, store)
+        paths.append(path)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count = 0
+    for path in paths:
+        count += len(load_conversation_history(path, store))
+    read = time.perf_counter() - start
+
+    # 条件付き集計: 指定モデルの遅い応答のレイテンシ合計
+    start = time.perf_counter()
+    total = 0.0
+    for path in paths:
+        for message in load_conversation_history(path, store):
+            if message.get("model") == MODELS[1] and message.get("latency", 0.0) > 2.0:
+                total += message["latency"]
+    query = time.perf_counter() - start
+
+    assert count == args.messages
+    size = directory_size(directory) + (directory_size(store.path) if store is not None else 0)
+    return {"write": write, "bytes": size, "read": read, "query": query, "total": total}
+
+
+def bench_columnar(root: str, export_format: str, args) -> Dict[str, float]:
+    """列指向形式"""
+    path = os.path.join(root, f"conversations.{export_format}")
+
+    start = time.perf_counter()
+    rows = export_conversations(make_sessions(args.messages, args.messages_per_session), path, export_format)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count = 0
+    for _, messages in iter_conversations(path):
+        count += len(messages)
+    read = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = 0.0
+    filters = [("model", "==", MODELS[1]), ("latency", ">", 2.0)]
+    for batch in read_batches(path, columns=["latency"], filters=filters):
+        total += sum(batch["latency"])
+    query = time.perf_counter() - start
+
+    assert rows == count == args.messages
+    size = directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+    return {"write": write, "bytes": size, "read": read, "query": query, "total": total}
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="会話履歴の一括エクスポートのベンチマーク")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="メッセージの総数")
+    parser.add_argument("--messages-per-session", type=int, default=20, help="1セッションあたりのメッセージ数")
+    parser.add_argument("--formats", nargs="+", choices=["parquet", "msgpack"], default=["parquet", "msgpack"], help="比較する形式")
+    parser.add_argument("--skip-json", action="store_true", help="従来のJSON形式の計測を省略する")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_export_")
+    results = {}
+    try:
+        if not args.skip_json:
+            results["json"] = bench_json(root, args)
+        for export_format in args.formats:
+            module = "pyarrow" if export_format == "parquet" else "msgpack"
+            if importlib.util.find_spec(module) is None:
+                print(f"{module} がインストールされていないため {export_format} を省略します")
+                continue
+            results[export_format] = bench_columnar(root, export_format, args)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{args.messages:,} メッセージ（{args.messages_per_session} メッセージ/セッション）")
+    print(f"{'形式':<10}{'書き込み':>10}{'サイズ':>12}{'全件読み込み':>14}{'条件付き集計':>14}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['write']:>9.2f}s{result['bytes'] / 2**20:>9.1f} MiB"
+              f"{result['read']:>13.2f}s{result['query']:>13.2f}s")
+
+    totals = {round(result["total"], 3) for result in results.values()}
+    if len(totals) > 1:
+        print(f"警告: 条件付き集計の結果が一致しません: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+次のターンの先読みのベンチマーク
+
+長い履歴に1ターン追加したときの準備時間（メッセージ変換）を、先読みあり・なしで比較する。
+先読みは Prefetcher で行う（APIキーとネットワークが不要なように、空の記録ファイルを再生するモデルを使用する）。
+--live を指定した場合は実際のAPIをツール付きで呼び出し、最初のチャンクが届くまでの時間（TTFT）を比較する。
+
+使用例:
+    python -m benchmarks.bench_prefetch --turns 500
+    python -m benchmarks.bench_prefetch --live --model chatgpt --repeat 5
+"""
+from typing import Dict, List, Any
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+# ベンチマーク中は埋め込みAPIへのアクセスを避けるため、検索拡張を無効にする
+os.environ.setdefault("RETRIEVAL_ENABLED", "0")
+
+from graph.nodes import create_model
+from graph.prefetch import Prefetcher
+from models import chatgpt, gemini
+from models.base import to_langchain_messages
+from models.recording import CallRecorder
+from models.replay import enable_replay, disable_replay
+from tools.builtin import DEFAULT_TOOLS
+from utils.helpers import conversion_cache_key
+
+
+SYSTEM_MESSAGE = "あなたは有能なアシスタントです。"
+
+
+def make_history(num_turns: int, body_size: int = 400) -> List[Dict[str, Any]]:
+    """
+    合成した会話履歴を生成
+
+    引数:
+        num_turns (int): ターン数
+        body_size (int): 1メッセージあたりのおおよその文字数
+
+    戻り値:
+        List[Dict[str, Any]]: メッセージのリスト
+    """
+    messages = []
+    for turn in range(num_turns):
+        messages.append({"role": "user", "content": f"質問 {turn} " + "詳細。" * (body_size // 3)})
+        messages.append({"role": "assistant", "content": f"回答 {turn} " + "説明。" * (body_size // 3)})
+    return messages
+
+
+def bench_conversion(num_turns: int, repeat: int) -> None:
+    """履歴の変換にかかる時間を先読みあり・なしで比較"""
+    history = make_history(num_turns)
+    prefetcher = Prefetcher(max_workers=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "empty.jsonl.gz")
+        CallRecorder(path).close()
+        enable_replay(path)
+        try:
+            cold, warm, background = [], [], []
+            for i in range(repeat):
+                messages = history + [{"role": "user", "content": f"次の質問 {i}"}]
+
+                # 先読みなし: 次のターンで履歴全体を変換する
+                start = time.perf_counter()
+                to_langchain_messages(messages, SYSTEM_MESSAGE, f"cold-{i}:chatgpt")
+                cold.append(time.perf_counter() - start)
+
+                # 先読みあり: 前のターンの終了後に準備を済ませておき、次のターンは追加分のみ変換する
+                session_id = f"warm-{i}"
+                info = prefetcher.schedule(session_id, "chatgpt", history, SYSTEM_MESSAGE).result()
+                if "error" in info:
+                    raise RuntimeError(info["error"])
+                background.append(info["elapsed"])
+                start = time.perf_counter()
+                to_langchain_messages(messages, SYSTEM_MESSAGE, conversion_cache_key(session_id, "chatgpt"))
+                warm.append(time.perf_counter() - start)
+        finally:
+            disable_replay()
+
+    print(f"履歴 {len(history)} メッセージ、{repeat} 回の中央値")
+    print(f"  先読みなし: {statistics.median(cold) * 1000:.2f} ミリ秒")
+    print(f"  先読みあり: {statistics.median(warm) * 1000:.3f} ミリ秒"
+          f"（バックグラウンドでの準備 {statistics.median(background) * 1000:.2f} ミリ秒）")
+
+
+def measure_ttft(model_type: str, messages: List[Dict[str, Any]], cache_key: str) -> float:
+    """グラフと同じくツールをバインドして呼び出し、最初のチャンクが届くまでの時間（秒）を計測"""
+    model = create_model(model_type)
+    start = time.perf_counter()
+    first = []
+
+    def on_chunk(content: str) -> None:
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    model.generate_with_tools(messages, DEFAULT_TOOLS, SYSTEM_MESSAGE, on_chunk=on_chunk, cache_key=cache_key)
+    return first[0] if first else time.perf_counter() - start
+
+
+def bench_live(model_type: str, num_turns: int, repeat: int, prime_cache: bool) -> None:
+    """実際のAPIで次のターンのTTFTを先読みあり・なしで比較"""
+    history = make_history(num_turns, body_size=200)
+    prefetcher = Prefetcher(max_workers=1, prime_cache=prime_cache)
+    cold, warm = [], []
+
+    for i in range(repeat):
+        messages = history + [{"role": "user", "content": f"「{i}」とだけ答えてください。"}]
+
+        # 先読みなし: クライアントを作り直し、接続の確立から行う
+        chatgpt.get_client.cache_clear()
+        gemini.get_client.cache_clear()
+        cold.append(measure_ttft(model_type, messages, f"cold-{i}:{model_type}"))
+
+        # 先読みあり: 前のターンの終了後に準備を済ませておく
+        chatgpt.get_client.cache_clear()
+        gemini.get_client.cache_clear()
+        session_id = f"warm-{i}"
+        info = prefetcher.schedule(session_id, model_type, history, SYSTEM_MESSAGE).result()
+        if "error" in info:
+            raise RuntimeError(info["error"])
+        warm.append(measure_ttft(model_type, messages, conversion_cache_key(session_id, model_type)))
+
+    print(f"{model_type}: 履歴 {len(history)} メッセージ、{repeat} 回の中央値")
+    print(f"  先読みなし: TTFT {statistics.median(cold) * 1000:.0f} ミリ秒")
+    print(f"  先読みあり: TTFT {statistics.median(warm) * 1000:.0f} ミリ秒")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="次のターンの先読みのベンチマーク")
+    parser.add_argument("--turns", type=int, default=500, help="履歴のターン数")
+    parser.add_argument("--repeat", type=int, default=20, help="計測回数")
+    parser.add_argument("--live", action="store_true", help="実際のAPIを呼び出してTTFTを計測する")
+    parser.add_argument("--model", choices=["chatgpt", "gemini"], default="chatgpt", help="計測するモデル（--live）")
+    parser.add_argument("--prime-cache", action="store_true", help="プロンプトキャッシュも準備する（--live、chatgptのみ）")
+    args = parser.parse_args()
+
+    if args.live:
+        bench_live(args.model, min(args.turns, 50), args.repeat, args.prime_cache)
+    else:
+        bench_conversion(args.turns, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
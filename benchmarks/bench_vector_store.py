@@ -0,0 +1,76 @@
+"""
+ベクトルストアのベンチマーク
+
+ランダムなベクトルでストアを構築し、追加・ロード・検索の時間を計測する
+
+使用例:
+    python -m benchmarks.bench_vector_store --count 1000000 --dim 384
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils.vector_store import VectorStore
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="ベクトルストアのベンチマーク")
+    parser.add_argument("--count", type=int, default=1_000_000, help="ベクトル数")
+    parser.add_argument("--dim", type=int, default=384, help="次元数")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="一度に追加するベクトル数")
+    parser.add_argument("--queries", type=int, default=32, help="一括検索するクエリ数")
+    parser.add_argument("--k", type=int, default=4, help="検索件数")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    path = tempfile.mkdtemp(prefix="bench_vector_store_")
+
+    try:
+        # 追加（バッチごとに追記）
+        store = VectorStore(path, dim=args.dim)
+        start = time.perf_counter()
+        for offset in range(0, args.count, args.batch_size):
+            n = min(args.batch_size, args.count - offset)
+            vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+            store.add(vectors, [{"source": "bench", "chunk": offset + i, "text": ""} for i in range(n)])
+        add_time = time.perf_counter() - start
+        print(f"追加: {args.count:,} 件 {add_time:.2f} 秒 ({args.count / add_time:,.0f} 件/秒)")
+
+        # ロード（メモリマップのためデータ量に依存しない）
+        start = time.perf_counter()
+        store = VectorStore(path)
+        load_time = time.perf_counter() - start
+        print(f"ロード: {load_time * 1000:.2f} ミリ秒")
+
+        # 検索（初回はページキャッシュの読み込みを含む）
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        for label in ("初回", "2回目"):
+            start = time.perf_counter()
+            store.search(queries[:1], k=args.k)
+            single_time = time.perf_counter() - start
+            print(f"単一クエリ検索（{label}）: {single_time * 1000:.1f} ミリ秒")
+
+        start = time.perf_counter()
+        store.search(queries, k=args.k)
+        batch_time = time.perf_counter() - start
+        print(
+            f"一括検索: {args.queries} クエリ {batch_time * 1000:.1f} ミリ秒 "
+            f"({batch_time * 1000 / args.queries:.2f} ミリ秒/クエリ)"
+        )
+
+        # 逐次検索との比較
+        start = time.perf_counter()
+        for query in queries:
+            store.search(query, k=args.k)
+        loop_time = time.perf_counter() - start
+        print(f"逐次検索: {args.queries} クエリ {loop_time * 1000:.1f} ミリ秒")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
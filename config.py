@@ -2,7 +2,13 @@
 設定ファイル
 環境変数と設定パラメータを管理
 """
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Any, Optional
+import json
 import os
+import threading
+import time
+
 from dotenv import load_dotenv
 
 # .envファイルから環境変数をロード（存在する場合）
@@ -13,20 +19,69 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 
 # OpenAI モデル設定
-OPENAI_MODEL = "gpt-4o"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 
 # Google Gemini モデル設定
-GEMINI_MODEL = "gemini-1.5-pro"
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+
+# LLM設定（起動時のデフォルト値。実行中の値は get_runtime_config() で取得する）
+DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", "0.7"))
+MAX_TOKENS = int(os.getenv("MAX_TOKENS", "1024"))
+
+# 実行中に変更可能な設定ファイル（変更は再起動なしで反映される）
+RUNTIME_CONFIG_PATH = os.getenv("RUNTIME_CONFIG_PATH", "runtime_config.json")
+RUNTIME_CONFIG_CHECK_INTERVAL = 1.0
+
+# 検索拡張（RAG）設定
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") != "0"
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vector_store")
+EMBEDDING_MODEL = "text-embedding-3-small"
+RETRIEVAL_TOP_K = 4
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# ブロブストア設定（システムメッセージ・長いメッセージ本文の重複排除）
+# 有効な場合、save_conversation_history は長いメッセージ本文をブロブストアに保存して参照のみを記録する
+# （履歴ファイルの読み込みにはブロブストアが必要になるため、デフォルトでは無効）
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "0") == "1"
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "blob_store")
+# 短い本文をブロブに移すとファイル数とディスク使用量がかえって増えるため、貼り付けられた資料程度の長さに限る
+BLOB_MIN_SIZE = 8192
+INTERN_CACHE_SIZE = 4096
+INTERN_CACHE_MAX_CHARS = 16_000_000
 
-# LLM設定
-DEFAULT_TEMPERATURE = 0.7
-MAX_TOKENS = 1024
+# ツール呼び出し設定
+# 結果を待つ時間（実行中のツールは停止されないため、ツール側で処理量を制限する）
+TOOL_TIMEOUT = 10.0
+TOOL_MAX_WORKERS = 8
+TOOL_CACHE_SIZE = 256
+MAX_TOOL_ITERATIONS = 5
+
+# モデル呼び出しの記録・再生設定（ネットワークを介さないプロファイリング用）
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "")
+LLM_REPLAY_TIMING = os.getenv("LLM_REPLAY_TIMING", "0") == "1"
+
+# 先読み（次のターンの準備）設定
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") != "0"
+# OpenAIのプロンプトキャッシュを準備するために、max_tokens=1のリクエストを送信する（入力トークンが課金される）
+PREFETCH_PRIME_CACHE = os.getenv("PREFETCH_PRIME_CACHE", "0") == "1"
+PREFETCH_MAX_WORKERS = 2
+CONVERSION_CACHE_SIZE = 1024
+
+# 会話履歴の一括エクスポート設定（分析用の列指向形式）
+# "parquet"（pyarrowが必要）、"msgpack"（msgpackが必要）、"auto"（利用可能な方）
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "auto")
+EXPORT_ROW_GROUP_SIZE = 65536
+EXPORT_COMPRESSION = "zstd"
 
 # アプリケーション設定
 APP_TITLE = "LangGraph LLM アプリケーション"
 APP_DESCRIPTION = """
 LangGraphを使用してGeminiとChatGPTを組み合わせた簡易アプリケーション
 """
+# 生成中に表示を更新する間隔（秒）。停止ボタンによる再実行は次の更新時に反映される
+UI_POLL_INTERVAL = 0.1
 
 # グラフ設定
 GRAPH_STATE_TYPE = {
@@ -34,5 +89,140 @@ GRAPH_STATE_TYPE = {
     "current_model": str,
     "user_input": str,
     "system_message": str,
+    "context": str,
     "response": str,
+    "tool_iterations": int,
+    "tool_latencies": dict,
+    "cancelled": bool,
+    "model_params": dict,
 }
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    """実行中に変更可能なモデルパラメータ"""
+    openai_model: str = OPENAI_MODEL
+    gemini_model: str = GEMINI_MODEL
+    temperature: float = DEFAULT_TEMPERATURE
+    max_tokens: int = MAX_TOKENS
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any], base: Optional["RuntimeConfig"] = None) -> "RuntimeConfig":
+        """
+        辞書から設定を作成（未知のキーとNoneは無視し、値は各フィールドの型に変換する）
+
+        引数:
+            values (Dict[str, Any]): 設定値
+            base (Optional[RuntimeConfig]): 指定されていない項目に使用する設定
+
+        戻り値:
+            RuntimeConfig: 新しい設定
+        """
+        types = {field.name: field.type for field in fields(cls)}
+        updates = {
+            name: types[name](value)
+            for name, value in (values or {}).items()
+            if name in types and value is not None
+        }
+        return replace(base or cls(), **updates)
+
+    def with_overrides(self, overrides: Optional[Dict[str, Any]]) -> "RuntimeConfig":
+        """
+        セッションごとの上書きを適用した設定を返す
+
+        引数:
+            overrides (Optional[Dict[str, Any]]): 上書きする設定値
+
+        戻り値:
+            RuntimeConfig: 上書きを適用した設定
+        """
+        if not overrides:
+            return self
+        return RuntimeConfig.from_dict(overrides, base=self)
+
+
+class RuntimeConfigWatcher:
+    """
+    設定ファイルの変更を監視するクラス
+
+    取得時に一定間隔でファイルの更新時刻を確認し、変更されていれば再読み込みする
+    """
+
+    def __init__(self, path: str = RUNTIME_CONFIG_PATH, check_interval: float = RUNTIME_CONFIG_CHECK_INTERVAL):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): 設定ファイル（JSON）のパス
+            check_interval (float): 更新時刻を確認する間隔（秒）
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._config = RuntimeConfig()
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> RuntimeConfig:
+        """
+        現在の設定を取得
+
+        戻り値:
+            RuntimeConfig: 現在の設定
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._config
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            except OSError as e:
+                print(f"設定ファイルの確認エラー: {self.path}: {e}")
+                return self._config
+
+            if mtime != self._mtime:
+                if mtime is None:
+                    self._config = RuntimeConfig()
+                else:
+                    text = self._read()
+                    if text is None:
+                        # 更新時刻を記録しないため、次の確認で再度読み込む
+                        return self._config
+                    self._config = self._parse(text)
+                self._mtime = mtime
+
+        return self._config
+
+    def _read(self) -> Optional[str]:
+        """設定ファイルを読み込む（一時的な失敗などで読み込めない場合はNone）"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"設定ファイルの読み込みエラー: {self.path}: {e}")
+            return None
+
+    def _parse(self, text: str) -> RuntimeConfig:
+        """設定ファイルの内容を解析する（内容が不正な場合は現在の設定を維持する）"""
+        try:
+            return RuntimeConfig.from_dict(json.loads(text))
+        except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+            print(f"設定ファイルの読み込みエラー: {self.path}: {e}")
+            return self._config
+
+
+_runtime_config_watcher = RuntimeConfigWatcher()
+
+
+def get_runtime_config() -> RuntimeConfig:
+    """
+    実行中の設定を取得（設定ファイルが変更されていれば再読み込みする）
+
+    戻り値:
+        RuntimeConfig: 現在の設定
+    """
+    return _runtime_config_watcher.get()
@@ -3,15 +3,23 @@ LangGraphビルダー
 
 グラフの構築と実行を担当
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 from langgraph.graph import StateGraph, END
 
+from utils.blob_store import intern_text
+from utils.cancellation import CancelToken
+from graph.prefetch import get_prefetcher
+from config import PREFETCH_ENABLED
 from graph.nodes import (
     GraphState,
     process_user_input,
+    retrieve_context,
     router,
     generate_with_chatgpt,
     generate_with_gemini,
+    should_call_tools,
+    route_after_tools,
+    execute_tools,
 )
 
 
@@ -27,23 +35,43 @@ def build_graph() -> StateGraph:
     
     # ノードを追加
     graph.add_node("process_input", process_user_input)
-    graph.add_node("router", router)
+    graph.add_node("retrieve_context", retrieve_context)
     graph.add_node("generate_chatgpt", generate_with_chatgpt)
     graph.add_node("generate_gemini", generate_with_gemini)
+    graph.add_node("tools", execute_tools)
     
     # エッジを追加（ノード間の接続）
-    graph.add_edge("process_input", "router")
+    graph.add_edge("process_input", "retrieve_context")
     graph.add_conditional_edges(
-        "router",
+        "retrieve_context",
+        router,
         {
             "to_chatgpt": "generate_chatgpt",
             "to_gemini": "generate_gemini",
         },
     )
     
-    # 各生成ノードから終了状態へ接続
-    graph.add_edge("generate_chatgpt", END)
-    graph.add_edge("generate_gemini", END)
+    # 各生成ノードから、ツール呼び出しがあればツールノードへ、なければ終了状態へ接続
+    for node in ("generate_chatgpt", "generate_gemini"):
+        graph.add_conditional_edges(
+            node,
+            should_call_tools,
+            {
+                "to_tools": "tools",
+                "to_end": END,
+            },
+        )
+    
+    # ツールの結果を受けて、ツールを要求したモデルで生成を続行（キャンセルされた場合は終了）
+    graph.add_conditional_edges(
+        "tools",
+        route_after_tools,
+        {
+            "to_chatgpt": "generate_chatgpt",
+            "to_gemini": "generate_gemini",
+            "to_end": END,
+        },
+    )
     
     # 開始ノードを設定
     graph.set_entry_point("process_input")
@@ -58,6 +86,10 @@ def run_graph(
     messages: Optional[List[Dict[str, str]]] = None,
     system_message: str = "",
     current_model: str = "chatgpt",
+    cancel_token: Optional[CancelToken] = None,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    model_params: Optional[Dict[str, Any]] = None,
+    session_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     グラフを実行する
@@ -68,6 +100,13 @@ def run_graph(
         messages (Optional[List[Dict[str, str]]]): 既存のメッセージ履歴
         system_message (str): システムメッセージ
         current_model (str): 現在のモデル
+        cancel_token (Optional[CancelToken]): キャンセルトークン。キャンセルされると生成を中断し、
+            途中までの応答を履歴に残して返す（結果のcancelledがTrueになる）
+        on_chunk (Optional[Callable[[str], None]]): ストリーミング中にそれまでの応答を受け取るコールバック
+        model_params (Optional[Dict[str, Any]]): セッションごとに上書きするモデルパラメータ
+            （openai_model、gemini_model、temperature、max_tokens）
+        session_id (Optional[str]): セッションID。指定した場合、応答を返した後に次のターンの
+            モデルの準備（クライアントの作成と接続の確立、履歴の変換）をバックグラウンドで開始する
 
     戻り値:
         Dict[str, Any]: グラフの実行結果
@@ -76,12 +115,36 @@ def run_graph(
     initial_state = {
         "messages": messages or [],
         "user_input": user_input,
-        "system_message": system_message,
+        "system_message": intern_text(system_message),
+        "context": "",
         "current_model": current_model,
         "response": "",
+        "tool_iterations": 0,
+        "tool_latencies": {},
+        "cancelled": False,
+        "model_params": model_params or {},
     }
     
     # グラフを実行
-    result = graph.invoke(initial_state)
+    result = graph.invoke(
+        initial_state,
+        config={
+            "configurable": {
+                "cancel_token": cancel_token,
+                "on_chunk": on_chunk,
+                "session_id": session_id,
+            },
+        },
+    )
+    
+    # 次のターンのモデルとプロンプトの先頭部分は確定しているため、ユーザーの入力中に準備しておく
+    if session_id and PREFETCH_ENABLED and not result.get("cancelled"):
+        get_prefetcher().schedule(
+            session_id,
+            result["current_model"],
+            result["messages"],
+            result["system_message"],
+            model_params,
+        )
     
     return result
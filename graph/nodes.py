@@ -3,12 +3,22 @@ LangGraphノードの定義
 
 各ノードは状態を受け取り、更新された状態を返す
 """
-from typing import Dict, Any, Annotated, TypedDict, List
+from typing import Dict, Any, Annotated, TypedDict, List, Optional
 import json
+import time
+
+from langchain_core.runnables import RunnableConfig
 
 from models.chatgpt import ChatGPTModel
 from models.gemini import GeminiModel
-from utils.helpers import determine_next_model
+from models.base import BaseLanguageModel
+from models.replay import ReplayModel, get_replay_store
+from utils.helpers import determine_next_model, attach_context, conversion_cache_key
+from utils.retrieval import retrieve, format_context
+from utils.cancellation import GenerationCancelled, get_cancel_token
+from tools.builtin import DEFAULT_TOOLS
+from tools.executor import get_tool_executor
+from config import MAX_TOOL_ITERATIONS, get_runtime_config
 
 
 class GraphState(TypedDict):
@@ -17,7 +27,12 @@ class GraphState(TypedDict):
     current_model: str
     user_input: str
     system_message: str
+    context: str
     response: str
+    tool_iterations: int
+    tool_latencies: Dict[str, List[float]]
+    cancelled: bool
+    model_params: Dict[str, Any]
 
 
 def process_user_input(
@@ -48,9 +63,37 @@ def process_user_input(
     }
 
 
+def retrieve_context(
+    state: GraphState,
+) -> Dict[str, Any]:
+    """
+    ユーザー入力に関連するドキュメントのチャンクを検索するノード
+
+    履歴に資料全文を含める代わりに、上位k件のチャンクのみを最後のユーザーメッセージに付加して送信する。
+    検索は補助的な機能のため、埋め込みAPIの障害などで失敗した場合はコンテキストなしで続行する。
+
+    引数:
+        state (GraphState): 現在のグラフ状態
+
+    戻り値:
+        Dict[str, Any]: 更新された状態
+    """
+    user_input = state.get("user_input", "")
+    
+    try:
+        chunks = retrieve(user_input)
+    except Exception as e:
+        print(f"参考資料の検索中にエラーが発生しました: {e}")
+        chunks = []
+    
+    return {
+        "context": format_context(chunks),
+    }
+
+
 def router(state: GraphState) -> str:
     """
-    使用するモデルを決定するルーターノード
+    使用するモデルを決定するルーター（条件付きエッジ）
 
     引数:
         state (GraphState): 現在のグラフ状態
@@ -66,29 +109,138 @@ def router(state: GraphState) -> str:
         return "to_gemini"
 
 
-def generate_with_chatgpt(
+def create_model(model_type: str, model_params: Optional[Dict[str, Any]] = None) -> BaseLanguageModel:
+    """
+    実行中の設定にセッションごとの上書きを適用してモデルをインスタンス化
+
+    再生モードでは記録された応答を返すモデルを使用する
+
+    引数:
+        model_type (str): モデルの種類 ("chatgpt" または "gemini")
+        model_params (Optional[Dict[str, Any]]): セッションごとに上書きするモデルパラメータ
+
+    戻り値:
+        BaseLanguageModel: モデルのラッパー
+    """
+    params = get_runtime_config().with_overrides(model_params)
+    model_name = params.openai_model if model_type == "chatgpt" else params.gemini_model
+    
+    replay_store = get_replay_store()
+    if replay_store is not None:
+        provider = "OpenAI" if model_type == "chatgpt" else "Google"
+        return ReplayModel(
+            replay_store,
+            provider,
+            model_name,
+            temperature=params.temperature,
+            max_tokens=params.max_tokens,
+        )
+    
+    model_class = ChatGPTModel if model_type == "chatgpt" else GeminiModel
+    return model_class(
+        model_name=model_name,
+        temperature=params.temperature,
+        max_tokens=params.max_tokens,
+    )
+
+
+def _response_metadata(model: Any, started: float, usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """アシスタントメッセージに記録するモデル名・レイテンシ・トークン使用量"""
+    return {
+        "model": model.model_name,
+        "latency": round(time.perf_counter() - started, 6),
+        "usage": {
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+        } if usage else None,
+    }
+
+
+def _generate_response(
+    model_type: str,
     state: GraphState,
+    config: Optional[RunnableConfig] = None,
 ) -> Dict[str, Any]:
     """
-    ChatGPTを使用して応答を生成するノード
+    モデルで応答を生成し、状態の更新内容を返す
+
+    ツール呼び出しの上限に達していなければツールをバインドして呼び出し、
+    モデルがツールを要求した場合は現在のモデルを維持したままツールノードへ進む。
+    生成がキャンセルされた場合は、それまでに受信した応答を履歴に残して終了する。
+    アシスタントメッセージには分析用にモデル名、レイテンシ（秒）、トークン使用量を記録する。
 
     引数:
+        model_type (str): 使用するモデルの種類 ("chatgpt" または "gemini")
         state (GraphState): 現在のグラフ状態
+        config (Optional[RunnableConfig]): キャンセルトークン、チャンクのコールバック、セッションIDを含む実行設定
 
     戻り値:
         Dict[str, Any]: 更新された状態
     """
+    model = create_model(model_type, state.get("model_params"))
     messages = state.get("messages", [])
-    system_message = state.get("system_message", "")
-
-    # ChatGPTモデルをインスタンス化
-    model = ChatGPTModel()
+    # 参考資料は最後のユーザーメッセージに付加し、システムメッセージと履歴の先頭部分を変えない
+    model_messages = attach_context(messages, state.get("context", ""))
+    tool_iterations = state.get("tool_iterations", 0)
+    configurable = (config or {}).get("configurable") or {}
+    session_id = configurable.get("session_id")
+    options = {
+        "system_message": state.get("system_message", ""),
+        "cancel_token": get_cancel_token(config),
+        "on_chunk": configurable.get("on_chunk"),
+        # 先読みで変換済みの履歴があれば、追加されたメッセージだけを変換する
+        "cache_key": conversion_cache_key(session_id, model_type) if session_id else None,
+    }
+    
+    started = time.perf_counter()
+    
+    try:
+        if tool_iterations < MAX_TOOL_ITERATIONS:
+            result = model.generate_with_tools(model_messages, DEFAULT_TOOLS, **options)
+        else:
+            # 上限に達した場合はツールなしで最終回答を生成させる
+            result = {
+                "content": model.generate_with_chat_history(model_messages, **options),
+                "tool_calls": [],
+                "usage": None,
+            }
+    except GenerationCancelled as e:
+        # 途中まで受信した応答は履歴に残す
+        if e.partial_response:
+            messages.append({
+                "role": "assistant",
+                "content": e.partial_response,
+                **_response_metadata(model, started, None),
+            })
+        return {
+            "messages": messages,
+            "response": e.partial_response,
+            "current_model": determine_next_model(state),
+            "cancelled": True,
+        }
+    
+    if result["tool_calls"]:
+        # ツール呼び出しを含むアシスタントメッセージを追加し、同じモデルで続行する
+        messages.append({
+            "role": "assistant",
+            "content": result["content"],
+            "tool_calls": result["tool_calls"],
+            **_response_metadata(model, started, result.get("usage")),
+        })
+        return {
+            "messages": messages,
+            "tool_iterations": tool_iterations + 1,
+        }
     
-    # 応答を生成
-    response = model.generate_with_chat_history(messages, system_message=system_message)
+    response = result["content"]
     
     # アシスタントメッセージを追加
-    messages.append({"role": "assistant", "content": response})
+    messages.append({
+        "role": "assistant",
+        "content": response,
+        **_response_metadata(model, started, result.get("usage")),
+    })
     
     # 次のモデルを決定
     next_model = determine_next_model(state)
@@ -100,35 +252,120 @@ def generate_with_chatgpt(
     }
 
 
+def generate_with_chatgpt(
+    state: GraphState,
+    config: Optional[RunnableConfig] = None,
+) -> Dict[str, Any]:
+    """
+    ChatGPTを使用して応答を生成するノード
+
+    引数:
+        state (GraphState): 現在のグラフ状態
+        config (Optional[RunnableConfig]): 実行設定
+
+    戻り値:
+        Dict[str, Any]: 更新された状態
+    """
+    return _generate_response("chatgpt", state, config)
+
+
 def generate_with_gemini(
     state: GraphState,
+    config: Optional[RunnableConfig] = None,
 ) -> Dict[str, Any]:
     """
     Google Geminiを使用して応答を生成するノード
 
     引数:
         state (GraphState): 現在のグラフ状態
+        config (Optional[RunnableConfig]): 実行設定
 
     戻り値:
         Dict[str, Any]: 更新された状態
     """
+    return _generate_response("gemini", state, config)
+
+
+def should_call_tools(state: GraphState) -> str:
+    """
+    生成ノードの後にツールを実行するかを決定する条件付きエッジ
+
+    引数:
+        state (GraphState): 現在のグラフ状態
+
+    戻り値:
+        str: 次のエッジの名前 ("to_tools" または "to_end")
+    """
     messages = state.get("messages", [])
-    system_message = state.get("system_message", "")
+    
+    if messages and messages[-1].get("tool_calls"):
+        return "to_tools"
+    else:
+        return "to_end"
+
+
+def route_after_tools(state: GraphState) -> str:
+    """
+    ツールノードの後の遷移先を決定する条件付きエッジ
+
+    キャンセルされた場合は生成ノードに戻らずに終了し、それ以外はツールを要求したモデルで生成を続行する
 
-    # Geminiモデルをインスタンス化
-    model = GeminiModel()
+    引数:
+        state (GraphState): 現在のグラフ状態
+
+    戻り値:
+        str: 次のエッジの名前 ("to_end"、"to_chatgpt" または "to_gemini")
+    """
+    if state.get("cancelled"):
+        return "to_end"
+    return router(state)
+
+
+def execute_tools(
+    state: GraphState,
+    config: Optional[RunnableConfig] = None,
+) -> Dict[str, Any]:
+    """
+    直前のアシスタントメッセージが要求したツールをすべて並列実行するノード
+
+    引数:
+        state (GraphState): 現在のグラフ状態
+        config (Optional[RunnableConfig]): 実行設定
+
+    戻り値:
+        Dict[str, Any]: 更新された状態
+    """
+    messages = state.get("messages", [])
+    tool_calls = messages[-1].get("tool_calls", [])
+    cancel_token = get_cancel_token(config)
     
-    # 応答を生成
-    response = model.generate_with_chat_history(messages, system_message=system_message)
+    if cancel_token is not None and cancel_token.cancelled:
+        # キャンセル済みの場合はツールを実行せず、呼び出しごとの結果だけを残して終了する
+        # （履歴の整合性のため、ツール呼び出しには必ず結果が対応している必要がある）
+        response = messages[-1].get("content", "")
+        messages.extend(
+            {"role": "tool", "content": "キャンセルされました", "tool_call_id": call["id"], "name": call["name"]}
+            for call in tool_calls
+        )
+        return {
+            "messages": messages,
+            "response": response,
+            "current_model": determine_next_model(state),
+            "cancelled": True,
+        }
     
-    # アシスタントメッセージを追加
-    messages.append({"role": "assistant", "content": response})
+    # ツールを並列実行
+    result = get_tool_executor().run(tool_calls)
     
-    # 次のモデルを決定
-    next_model = determine_next_model(state)
+    # ツールの結果を追加
+    messages.extend(result["messages"])
+    
+    # ツールごとのレイテンシを記録
+    tool_latencies = {name: list(values) for name, values in state.get("tool_latencies", {}).items()}
+    for name, values in result["latencies"].items():
+        tool_latencies.setdefault(name, []).extend(values)
     
     return {
         "messages": messages,
-        "response": response,
-        "current_model": next_model,
+        "tool_latencies": tool_latencies,
     }
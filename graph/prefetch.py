@@ -0,0 +1,109 @@
+"""
+次のターンの先読み
+
+モデルは交互に使用されるため、応答を返した時点で次のターンのプロバイダーと
+プロンプトの先頭部分（システムメッセージと履歴）が確定している。ユーザーが入力している間に
+バックグラウンドでクライアントを作成して接続を確立し、履歴の変換を済ませておく。
+検索した参考資料は最後のユーザーメッセージに付加されるため、この先頭部分はターンをまたいで変わらない。
+"""
+from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import lru_cache
+import time
+
+from graph.nodes import create_model
+from models.base import to_langchain_messages
+from tools.builtin import DEFAULT_TOOLS
+from utils.helpers import conversion_cache_key
+from config import PREFETCH_MAX_WORKERS, PREFETCH_PRIME_CACHE
+
+
+class Prefetcher:
+    """
+    次のターンの準備をバックグラウンドで行うクラス
+
+    準備の効果は共有クライアントと変換済みメッセージのキャッシュを通じて次のターンに引き継がれる
+    """
+
+    def __init__(
+        self,
+        max_workers: int = PREFETCH_MAX_WORKERS,
+        prime_cache: bool = PREFETCH_PRIME_CACHE,
+    ):
+        """
+        初期化メソッド
+
+        引数:
+            max_workers (int): 準備を並列に行うスレッド数
+            prime_cache (bool): プロバイダーのプロンプトキャッシュを準備する場合はTrue
+        """
+        self.prime_cache = prime_cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def schedule(
+        self,
+        session_id: str,
+        model_type: str,
+        messages: List[Dict[str, Any]],
+        system_message: str = "",
+        model_params: Optional[Dict[str, Any]] = None,
+    ) -> Future:
+        """
+        次のターンの準備を開始する
+
+        引数:
+            session_id (str): セッションID
+            model_type (str): 次のターンで使用するモデルの種類 ("chatgpt" または "gemini")
+            messages (List[Dict[str, Any]]): 現在までの履歴
+            system_message (str): システムメッセージ
+            model_params (Optional[Dict[str, Any]]): セッションごとに上書きするモデルパラメータ
+
+        戻り値:
+            Future: model_type、message_count、primed、elapsed（失敗した場合はerror）を含む辞書
+        """
+        return self._pool.submit(
+            self._prefetch, session_id, model_type, list(messages), system_message, model_params
+        )
+
+    def _prefetch(
+        self,
+        session_id: str,
+        model_type: str,
+        messages: List[Dict[str, Any]],
+        system_message: str,
+        model_params: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """準備を行う（ワーカースレッド上で実行される）"""
+        started = time.perf_counter()
+        result = {"model_type": model_type, "message_count": len(messages), "primed": False}
+
+        try:
+            # クライアントは共有されているため、ここで作成・接続したものが次のターンで再利用される
+            model = create_model(model_type, model_params)
+
+            # 履歴を変換してキャッシュに保存（次のターンは追加されたメッセージだけを変換する）
+            langchain_messages = to_langchain_messages(
+                messages,
+                system_message,
+                conversion_cache_key(session_id, model_type),
+            )
+
+            result.update(model.warm_up(langchain_messages, DEFAULT_TOOLS, prime_cache=self.prime_cache))
+        except Exception as e:
+            # 先読みは最適化のため、失敗しても次のターンの処理には影響しない
+            result["error"] = str(e)
+            print(f"次のターンの準備中にエラーが発生しました: {e}")
+
+        result["elapsed"] = time.perf_counter() - started
+        return result
+
+
+@lru_cache(maxsize=1)
+def get_prefetcher() -> Prefetcher:
+    """
+    プロセス内で共有する先読みクラスを取得
+
+    戻り値:
+        Prefetcher: 先読みクラス
+    """
+    return Prefetcher()
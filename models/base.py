@@ -4,15 +4,136 @@
 すべてのLLMラッパーの基底クラス
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Sequence, Callable
+from collections import OrderedDict
+import queue
+import threading
+import time
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, BaseMessage
+
+from models.recording import get_recorder
+from utils.cancellation import CancelToken
+from config import CONVERSION_CACHE_SIZE
+
+
+def _convert_message(message: Dict[str, Any]) -> Optional[BaseMessage]:
+    """メッセージ辞書を1件LangChainのメッセージに変換（未知のroleはNone）"""
+    if message["role"] == "user":
+        return HumanMessage(content=message["content"])
+    elif message["role"] == "assistant":
+        return AIMessage(content=message["content"], tool_calls=message.get("tool_calls", []))
+    elif message["role"] == "system":
+        return SystemMessage(content=message["content"])
+    elif message["role"] == "tool":
+        return ToolMessage(
+            content=message["content"],
+            tool_call_id=message["tool_call_id"],
+            name=message.get("name"),
+        )
+    return None
+
+
+class MessageConversionCache:
+    """
+    変換済みメッセージのキャッシュ
+
+    キー（セッションとモデルの組み合わせなど）ごとに前回変換した履歴を保持し、
+    履歴の先頭が一致する場合は追加されたメッセージだけを変換する
+    """
+
+    def __init__(self, max_size: int = CONVERSION_CACHE_SIZE):
+        """
+        初期化メソッド
+
+        引数:
+            max_size (int): 保持するキーの最大数
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def convert(self, key: str, messages: List[Dict[str, Any]]) -> List[Optional[BaseMessage]]:
+        """
+        キャッシュを利用してメッセージを変換
+
+        引数:
+            key (str): キャッシュのキー
+            messages (List[Dict[str, Any]]): チャットメッセージのリスト
+
+        戻り値:
+            List[Optional[BaseMessage]]: 変換されたメッセージ（messagesと同じ長さ、未知のroleはNone）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        reused = []
+        if entry is not None:
+            source, converted = entry
+            # 同じ辞書オブジェクトであれば比較は同一性の確認だけで済む
+            if len(source) <= len(messages) and all(a is b or a == b for a, b in zip(source, messages)):
+                reused = converted
+
+        result = reused + [_convert_message(message) for message in messages[len(reused):]]
+
+        with self._lock:
+            self._entries[key] = (list(messages), result)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return result
+
+
+conversion_cache = MessageConversionCache()
+
+
+def to_langchain_messages(
+    messages: List[Dict[str, Any]],
+    system_message: Optional[str] = None,
+    cache_key: Optional[str] = None,
+) -> List[BaseMessage]:
+    """
+    メッセージ辞書のリストをLangChainのメッセージに変換
+
+    引数:
+        messages (List[Dict[str, Any]]): チャットメッセージのリスト
+            各メッセージはrole（"user"、"assistant"、"system"、"tool"）とcontent（内容）を含む辞書
+            ツール呼び出しを含むアシスタントメッセージはtool_callsを、ツールの結果はtool_call_idとnameを持つ
+        system_message (Optional[str]): システムメッセージ
+        cache_key (Optional[str]): 指定した場合、同じキーで前回変換した履歴を再利用し、差分のみを変換する
+
+    戻り値:
+        List[BaseMessage]: LangChainのメッセージのリスト
+    """
+    langchain_messages = []
+    
+    # システムメッセージがある場合は追加
+    if system_message:
+        langchain_messages.append(SystemMessage(content=system_message))
+    
+    # メッセージ履歴を変換
+    if cache_key is None:
+        converted = [_convert_message(message) for message in messages]
+    else:
+        converted = conversion_cache.convert(cache_key, messages)
+    langchain_messages.extend(message for message in converted if message is not None)
+    
+    return langchain_messages
 
 
 class BaseLanguageModel(ABC):
     """
     言語モデルの基底抽象クラス
     すべてのLLMラッパーはこのクラスを継承する必要があります
+
+    サブクラスは共有のLangChainチャットモデルをclientに、リクエストごとのパラメータをinvoke_kwargsに、
+    パラメータをバインドしたものをmodelに設定します
     """
 
+    # 共有クライアントとツールの組み合わせごとのバインド済みモデル
+    _tool_bindings: Dict[Any, Any] = {}
+
     @abstractmethod
     def generate(self, prompt: str, **kwargs) -> str:
         """
@@ -42,6 +163,214 @@ class BaseLanguageModel(ABC):
         """
         pass
 
+    def _invoke(
+        self,
+        runnable: Any,
+        langchain_messages: List[BaseMessage],
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> AIMessage:
+        """
+        LangChainのチャットモデルを呼び出す
+
+        キャンセルトークンまたはチャンクのコールバックが指定された場合はストリーミングで呼び出す。
+        ストリームはワーカースレッドで受信し、呼び出し元のスレッドはチャンクとキャンセルの両方を待つため、
+        プロバイダーが応答を止めていてもキャンセルは即座に反映される。キャンセル時や例外発生時は
+        ストリームの受信を打ち切ってHTTPリクエストを切断する。ただし、LangChainは受信中のHTTP応答を
+        外部から閉じる手段を提供しないため、受信待ちの途中でキャンセルした場合は、受信スレッドとHTTP接続が
+        プロバイダーから次のチャンクが届く（またはタイムアウトする）まで残り、その時点で切断される。
+        記録モードが有効な場合は、完了した呼び出しのリクエストと応答（ストリーミング時はチャンクのタイミングを含む）を記録する。
+
+        引数:
+            runnable (Any): LangChainのチャットモデル（ツールをバインドしたものを含む）
+            langchain_messages (List[BaseMessage]): 送信するメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン
+            on_chunk (Optional[Callable[[str], None]]): チャンク受信ごとにそれまでの応答を受け取るコールバック
+                （呼び出し元のスレッドで実行される）
+
+        戻り値:
+            AIMessage: モデルの応答
+
+        例外:
+            GenerationCancelled: 生成がキャンセルされた場合（この呼び出しで受信した応答を保持する）
+        """
+        recorder = get_recorder()
+        started = time.perf_counter()
+        
+        if cancel_token is None and on_chunk is None:
+            response = runnable.invoke(langchain_messages)
+            if recorder is not None:
+                self._record(recorder, langchain_messages, response, None, started)
+            return response
+        
+        if cancel_token is not None:
+            # 前の呼び出し（ツール呼び出し前の生成など）の応答を引き継がない
+            cancel_token.partial_response = ""
+            cancel_token.raise_if_cancelled()
+        
+        events: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        
+        def receive() -> None:
+            try:
+                stream = runnable.stream(langchain_messages)
+            except BaseException as e:
+                events.put(("error", e, None))
+                return
+            try:
+                for chunk in stream:
+                    events.put(("chunk", chunk, time.perf_counter()))
+                    if stop.is_set():
+                        break
+                events.put(("done", None, None))
+            except BaseException as e:
+                events.put(("error", e, None))
+            finally:
+                # ジェネレーターを閉じることで、プロバイダーとの接続を待たずに切断する
+                stream.close()
+        
+        threading.Thread(target=receive, name="llm-stream", daemon=True).start()
+        unregister = (
+            cancel_token.add_callback(lambda: events.put(("cancelled", None, None)))
+            if cancel_token is not None else None
+        )
+        
+        response = None
+        chunks = [] if recorder is not None else None
+        try:
+            while True:
+                kind, value, received_at = events.get()
+                if kind == "chunk":
+                    response = value if response is None else response + value
+                    if chunks is not None:
+                        chunks.append([round(received_at - started, 6), value.content])
+                    if cancel_token is not None:
+                        cancel_token.partial_response = response.content
+                        if cancel_token.cancelled:
+                            break
+                    if on_chunk is not None:
+                        on_chunk(response.content)
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+        finally:
+            # 受信スレッドに打ち切りを通知する（正常終了時は何もしない）
+            stop.set()
+            if unregister is not None:
+                unregister()
+        
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        
+        response = response if response is not None else AIMessage(content="")
+        if recorder is not None:
+            self._record(recorder, langchain_messages, response, chunks, started)
+        return response
+
+    def _record(
+        self,
+        recorder: Any,
+        langchain_messages: List[BaseMessage],
+        response: AIMessage,
+        chunks: Optional[List[List[Any]]],
+        started: float,
+    ) -> None:
+        """完了した呼び出しを記録する"""
+        recorder.record(
+            self.get_model_info()["provider"],
+            self.model_name,
+            langchain_messages,
+            response,
+            chunks,
+            time.perf_counter() - started,
+        )
+
+    def generate_with_tools(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Sequence[Any],
+        system_message: str = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[str] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        ツールを利用可能にしたテキスト生成
+
+        共有クライアントにツールをバインドして呼び出す。ツールのバインドは
+        クライアントとツールの組み合わせごとにキャッシュされ、パラメータはリクエストごとにバインドされる。
+
+        引数:
+            messages (List[Dict[str, Any]]): チャットメッセージのリスト
+            tools (Sequence[Any]): LangChainのツール
+            system_message (str, optional): システムメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン
+            on_chunk (Optional[Callable[[str], None]]): ストリーミング中のコールバック
+            cache_key (Optional[str]): 変換済みメッセージのキャッシュのキー
+            **kwargs: モデル固有の追加パラメータ
+
+        戻り値:
+            Dict[str, Any]: content（生成されたテキスト）、tool_calls（ツール呼び出しのリスト）、
+            usage（input_tokens・output_tokens・total_tokens、取得できない場合はNone）を含む辞書
+        """
+        # 応答を生成
+        response = self._invoke(
+            self._bind_tools(tools),
+            to_langchain_messages(messages, system_message, cache_key),
+            cancel_token,
+            on_chunk,
+        )
+        
+        return {
+            "content": response.content,
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"], "id": call["id"]}
+                for call in response.tool_calls
+            ],
+            "usage": getattr(response, "usage_metadata", None),
+        }
+
+    def _bind_tools(self, tools: Sequence[Any]) -> Any:
+        """
+        共有クライアントにツールとリクエストごとのパラメータをバインドする
+
+        ツールのバインドはクライアントとツールの組み合わせごとにキャッシュされる
+
+        引数:
+            tools (Sequence[Any]): LangChainのツール
+
+        戻り値:
+            Any: 呼び出し可能なバインド済みモデル
+        """
+        key = (id(self.client), tuple(tool.name for tool in tools))
+        if key not in BaseLanguageModel._tool_bindings:
+            BaseLanguageModel._tool_bindings[key] = self.client.bind_tools(list(tools))
+        return BaseLanguageModel._tool_bindings[key].bind(**self.invoke_kwargs)
+
+    def warm_up(
+        self,
+        langchain_messages: List[BaseMessage],
+        tools: Sequence[Any] = (),
+        prime_cache: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        次のターンに備えてモデルを準備する（アイドル時に呼び出される）
+
+        デフォルトでは何もしない（共有クライアントはインスタンス化の時点で作成済み）。
+        プロバイダーごとのラッパーは、接続の確立やプロンプトキャッシュの準備などを行う。
+
+        引数:
+            langchain_messages (List[BaseMessage]): 次のターンで送信されるメッセージの先頭部分
+            tools (Sequence[Any]): 次のターンでバインドされるツール
+            prime_cache (bool): プロバイダーのプロンプトキャッシュを準備する場合はTrue
+
+        戻り値:
+            Dict[str, Any]: primed（プロンプトキャッシュを準備した場合はTrue）を含む辞書
+        """
+        return {"primed": False}
+
     @abstractmethod
     def get_model_info(self) -> Dict[str, Any]:
         """
@@ -1,13 +1,33 @@
 """
 ChatGPT (OpenAI) モデルラッパー
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Sequence
+from functools import lru_cache
 
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain.schema import HumanMessage, SystemMessage
 
-from models.base import BaseLanguageModel
-from config import OPENAI_API_KEY, OPENAI_MODEL, DEFAULT_TEMPERATURE, MAX_TOKENS
+from models.base import BaseLanguageModel, to_langchain_messages
+from utils.cancellation import CancelToken
+from config import OPENAI_API_KEY, OPENAI_MODEL, get_runtime_config
+
+
+@lru_cache(maxsize=None)
+def get_client(api_key: Optional[str] = OPENAI_API_KEY) -> ChatOpenAI:
+    """
+    ChatOpenAIクライアントを取得
+
+    接続プールを再利用するため、クライアントはAPIキーごとに1つだけ作成する。
+    モデル名・temperature・max_tokensはリクエスト時にバインドするため、設定変更の影響を受けない。
+
+    引数:
+        api_key (Optional[str]): OpenAI APIキー
+
+    戻り値:
+        ChatOpenAI: 共有のクライアント
+    """
+    # ストリーミング時もトークン使用量を受け取る（最後のチャンクに含まれる）
+    return ChatOpenAI(model_name=OPENAI_MODEL, openai_api_key=api_key, stream_usage=True)
 
 
 class ChatGPTModel(BaseLanguageModel):
@@ -15,32 +35,38 @@ class ChatGPTModel(BaseLanguageModel):
 
     def __init__(
         self,
-        model_name: str = OPENAI_MODEL,
-        temperature: float = DEFAULT_TEMPERATURE,
-        max_tokens: int = MAX_TOKENS,
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
         api_key: Optional[str] = OPENAI_API_KEY,
     ):
         """
         初期化メソッド
 
+        省略したパラメータには実行中の設定（get_runtime_config()）の値が使用される。
+        パラメータはリクエストごとにバインドされ、クライアントは共有されるため、
+        インスタンス化のたびに接続が作り直されることはない。
+
         引数:
-            model_name (str): 使用するモデル名
-            temperature (float): 生成の多様性を制御するパラメータ
-            max_tokens (int): 生成するトークンの最大数
+            model_name (Optional[str]): 使用するモデル名
+            temperature (Optional[float]): 生成の多様性を制御するパラメータ
+            max_tokens (Optional[int]): 生成するトークンの最大数
             api_key (Optional[str]): OpenAI APIキー
         """
-        self.model_name = model_name
-        self.temperature = temperature
-        self.max_tokens = max_tokens
+        runtime_config = get_runtime_config()
+        self.model_name = model_name or runtime_config.openai_model
+        self.temperature = runtime_config.temperature if temperature is None else temperature
+        self.max_tokens = runtime_config.max_tokens if max_tokens is None else max_tokens
         self.api_key = api_key
 
-        # LangChain ChatOpenAIモデルをインスタンス化
-        self.model = ChatOpenAI(
-            model_name=model_name,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            openai_api_key=api_key,
-        )
+        # 共有のChatOpenAIクライアントに、リクエストごとのパラメータをバインド
+        self.client = get_client(api_key)
+        self.invoke_kwargs = {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        self.model = self.client.bind(**self.invoke_kwargs)
 
     def generate(self, prompt: str, system_message: str = None, **kwargs) -> str:
         """
@@ -64,12 +90,18 @@ class ChatGPTModel(BaseLanguageModel):
         messages.append(HumanMessage(content=prompt))
         
         # 応答を生成
-        response = self.model.invoke(messages)
+        response = self._invoke(self.model, messages)
         
         return response.content
 
     def generate_with_chat_history(
-        self, messages: List[Dict[str, str]], system_message: str = None, **kwargs
+        self,
+        messages: List[Dict[str, str]],
+        system_message: str = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[str] = None,
+        **kwargs,
     ) -> str:
         """
         チャット履歴を考慮したテキスト生成
@@ -78,31 +110,56 @@ class ChatGPTModel(BaseLanguageModel):
             messages (List[Dict[str, str]]): チャットメッセージのリスト
                 各メッセージはrole（"user"または"assistant"）とcontent（内容）を含む辞書
             system_message (str, optional): システムメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン（指定時はストリーミングで生成）
+            on_chunk (Optional[Callable[[str], None]]): ストリーミング中のコールバック
+            cache_key (Optional[str]): 変換済みメッセージのキャッシュのキー
             **kwargs: モデル固有の追加パラメータ
 
         戻り値:
             str: 生成されたテキスト
+
+        例外:
+            GenerationCancelled: 生成がキャンセルされた場合
         """
-        langchain_messages = []
-        
-        # システムメッセージがある場合は追加
-        if system_message:
-            langchain_messages.append(SystemMessage(content=system_message))
-        
-        # メッセージ履歴を変換
-        for message in messages:
-            if message["role"] == "user":
-                langchain_messages.append(HumanMessage(content=message["content"]))
-            elif message["role"] == "assistant":
-                langchain_messages.append(AIMessage(content=message["content"]))
-            elif message["role"] == "system":
-                langchain_messages.append(SystemMessage(content=message["content"]))
+        langchain_messages = to_langchain_messages(messages, system_message, cache_key)
         
         # 応答を生成
-        response = self.model.invoke(langchain_messages)
+        response = self._invoke(self.model, langchain_messages, cancel_token, on_chunk)
         
         return response.content
 
+    def warm_up(
+        self,
+        langchain_messages: List[Any],
+        tools: Sequence[Any] = (),
+        prime_cache: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        次のターンに備えてモデルを準備する
+
+        共有クライアントの接続プールに接続を確立する（トークンは消費しない）。prime_cacheがTrueの場合は、
+        OpenAIが自動で行うプロンプトキャッシュ（1024トークン以上の先頭部分が対象）を
+        max_tokens=1 のリクエストで準備する。キャッシュはツール定義を含むプロンプトの先頭部分に対して
+        作られるため、次のターンと同じツールとパラメータをバインドして送信する。
+        対象となるかはトークン数をローカルで計算して判定する。
+
+        引数:
+            langchain_messages (List[Any]): 次のターンで送信されるメッセージの先頭部分
+            tools (Sequence[Any]): 次のターンでバインドされるツール
+            prime_cache (bool): プロンプトキャッシュを準備する場合はTrue
+
+        戻り値:
+            Dict[str, Any]: primed（プロンプトキャッシュを準備した場合はTrue）を含む辞書
+        """
+        self.client.root_client.models.retrieve(self.model_name)
+        
+        if prime_cache and self.client.get_num_tokens_from_messages(langchain_messages) >= 1024:
+            runnable = self._bind_tools(tools) if tools else self.model
+            runnable.invoke(langchain_messages, max_tokens=1)
+            return {"primed": True}
+        
+        return {"primed": False}
+
     def get_model_info(self) -> Dict[str, Any]:
         """
         モデル情報を取得
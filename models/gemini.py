@@ -1,13 +1,33 @@
 """
 Google Gemini モデルラッパー
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable
+from functools import lru_cache
 
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain.schema import HumanMessage, SystemMessage
 
-from models.base import BaseLanguageModel
-from config import GOOGLE_API_KEY, GEMINI_MODEL, DEFAULT_TEMPERATURE, MAX_TOKENS
+from models.base import BaseLanguageModel, to_langchain_messages
+from utils.cancellation import CancelToken
+from config import GOOGLE_API_KEY, get_runtime_config
+
+
+@lru_cache(maxsize=None)
+def get_client(model_name: str, api_key: Optional[str] = GOOGLE_API_KEY) -> ChatGoogleGenerativeAI:
+    """
+    ChatGoogleGenerativeAIクライアントを取得
+
+    ChatGoogleGenerativeAIはモデル名をリクエスト時に変更できないため、クライアントはモデル名と
+    APIキーの組み合わせごとに1つだけ作成する。temperatureとmax_tokensはリクエスト時にバインドする。
+
+    引数:
+        model_name (str): 使用するモデル名
+        api_key (Optional[str]): Google API キー
+
+    戻り値:
+        ChatGoogleGenerativeAI: 共有のクライアント
+    """
+    return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)
 
 
 class GeminiModel(BaseLanguageModel):
@@ -15,32 +35,39 @@ class GeminiModel(BaseLanguageModel):
 
     def __init__(
         self,
-        model_name: str = GEMINI_MODEL,
-        temperature: float = DEFAULT_TEMPERATURE,
-        max_tokens: int = MAX_TOKENS,
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
         api_key: Optional[str] = GOOGLE_API_KEY,
     ):
         """
         初期化メソッド
 
+        省略したパラメータには実行中の設定（get_runtime_config()）の値が使用される。
+        temperatureとmax_tokensはリクエストごとにバインドされ、クライアントは共有されるため、
+        インスタンス化のたびに接続が作り直されることはない。
+
         引数:
-            model_name (str): 使用するモデル名
-            temperature (float): 生成の多様性を制御するパラメータ
-            max_tokens (int): 生成するトークンの最大数
+            model_name (Optional[str]): 使用するモデル名
+            temperature (Optional[float]): 生成の多様性を制御するパラメータ
+            max_tokens (Optional[int]): 生成するトークンの最大数
             api_key (Optional[str]): Google API キー
         """
-        self.model_name = model_name
-        self.temperature = temperature
-        self.max_tokens = max_tokens
+        runtime_config = get_runtime_config()
+        self.model_name = model_name or runtime_config.gemini_model
+        self.temperature = runtime_config.temperature if temperature is None else temperature
+        self.max_tokens = runtime_config.max_tokens if max_tokens is None else max_tokens
         self.api_key = api_key
 
-        # LangChain GoogleGenerativeAIモデルをインスタンス化
-        self.model = ChatGoogleGenerativeAI(
-            model=model_name,
-            temperature=temperature,
-            max_output_tokens=max_tokens,
-            google_api_key=api_key,
-        )
+        # 共有のChatGoogleGenerativeAIクライアントに、リクエストごとの生成設定をバインド
+        self.client = get_client(self.model_name, api_key)
+        self.invoke_kwargs = {
+            "generation_config": {
+                "temperature": self.temperature,
+                "max_output_tokens": self.max_tokens,
+            },
+        }
+        self.model = self.client.bind(**self.invoke_kwargs)
 
     def generate(self, prompt: str, system_message: str = None, **kwargs) -> str:
         """
@@ -64,12 +91,18 @@ class GeminiModel(BaseLanguageModel):
         messages.append(HumanMessage(content=prompt))
         
         # 応答を生成
-        response = self.model.invoke(messages)
+        response = self._invoke(self.model, messages)
         
         return response.content
 
     def generate_with_chat_history(
-        self, messages: List[Dict[str, str]], system_message: str = None, **kwargs
+        self,
+        messages: List[Dict[str, str]],
+        system_message: str = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[str] = None,
+        **kwargs,
     ) -> str:
         """
         チャット履歴を考慮したテキスト生成
@@ -78,28 +111,21 @@ class GeminiModel(BaseLanguageModel):
             messages (List[Dict[str, str]]): チャットメッセージのリスト
                 各メッセージはrole（"user"または"assistant"）とcontent（内容）を含む辞書
             system_message (str, optional): システムメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン（指定時はストリーミングで生成）
+            on_chunk (Optional[Callable[[str], None]]): ストリーミング中のコールバック
+            cache_key (Optional[str]): 変換済みメッセージのキャッシュのキー
             **kwargs: モデル固有の追加パラメータ
 
         戻り値:
             str: 生成されたテキスト
+
+        例外:
+            GenerationCancelled: 生成がキャンセルされた場合
         """
-        langchain_messages = []
-        
-        # システムメッセージがある場合は追加
-        if system_message:
-            langchain_messages.append(SystemMessage(content=system_message))
-        
-        # メッセージ履歴を変換
-        for message in messages:
-            if message["role"] == "user":
-                langchain_messages.append(HumanMessage(content=message["content"]))
-            elif message["role"] == "assistant":
-                langchain_messages.append(AIMessage(content=message["content"]))
-            elif message["role"] == "system":
-                langchain_messages.append(SystemMessage(content=message["content"]))
+        langchain_messages = to_langchain_messages(messages, system_message, cache_key)
         
         # 応答を生成
-        response = self.model.invoke(langchain_messages)
+        response = self._invoke(self.model, langchain_messages, cancel_token, on_chunk)
         
         return response.content
 
@@ -0,0 +1,192 @@
+"""
+モデル呼び出しの記録
+
+プロバイダーへのリクエストと応答（ストリーミングのチャンクとそのタイミングを含む）を
+gzip圧縮したJSON Lines形式で記録する。記録は1件ごとに独立したgzipメンバーとして追記されるため、
+プロセスが強制終了しても、それまでの記録は読み込める。
+"""
+from typing import Dict, List, Any, Optional, Iterator
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+import zlib
+
+from config import LLM_RECORD_PATH
+
+
+def serialize_messages(langchain_messages: List[Any]) -> List[Dict[str, Any]]:
+    """
+    LangChainのメッセージを記録用の辞書に変換
+
+    引数:
+        langchain_messages (List[Any]): LangChainのメッセージ
+
+    戻り値:
+        List[Dict[str, Any]]: type、content、および必要に応じてtool_calls・tool_call_id・nameを含む辞書のリスト
+    """
+    serialized = []
+    for message in langchain_messages:
+        item = {"type": message.type, "content": message.content}
+        if getattr(message, "tool_calls", None):
+            item["tool_calls"] = [
+                {"name": call["name"], "args": call["args"], "id": call["id"]}
+                for call in message.tool_calls
+            ]
+        if getattr(message, "tool_call_id", None):
+            item["tool_call_id"] = message.tool_call_id
+            item["name"] = message.name
+        serialized.append(item)
+    return serialized
+
+
+def request_key(provider: str, model_name: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    リクエストを識別するキーを計算
+
+    引数:
+        provider (str): プロバイダー名
+        model_name (str): モデル名
+        messages (List[Dict[str, Any]]): serialize_messagesで変換したメッセージ
+
+    戻り値:
+        str: SHA-256ハッシュ
+    """
+    payload = json.dumps([provider, model_name, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CallRecorder:
+    """モデル呼び出しをファイルに追記するクラス"""
+
+    def __init__(self, path: str):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): 記録先のファイル（.jsonl.gz）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def record(
+        self,
+        provider: str,
+        model_name: str,
+        langchain_messages: List[Any],
+        response: Any,
+        chunks: Optional[List[List[Any]]],
+        latency: float,
+    ) -> None:
+        """
+        1回の呼び出しを記録する
+
+        引数:
+            provider (str): プロバイダー名
+            model_name (str): モデル名
+            langchain_messages (List[Any]): 送信したLangChainのメッセージ
+            response (Any): モデルの応答（AIMessage）
+            chunks (Optional[List[List[Any]]]): ストリーミング時の [開始からの経過秒, 差分テキスト] のリスト
+            latency (float): 呼び出し全体の所要時間（秒）
+        """
+        messages = serialize_messages(langchain_messages)
+        record = {
+            "key": request_key(provider, model_name, messages),
+            "provider": provider,
+            "model": model_name,
+            "messages": messages,
+            "response": {
+                "content": response.content,
+                "tool_calls": [
+                    {"name": call["name"], "args": call["args"], "id": call["id"]}
+                    for call in getattr(response, "tool_calls", [])
+                ],
+                "usage": getattr(response, "usage_metadata", None),
+            },
+            "chunks": chunks,
+            "latency": round(latency, 6),
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        # 1件ごとに完結したgzipメンバーとして書き込む（連結されたメンバーは1つのgzipファイルとして読める）
+        member = gzip.compress(line.encode("utf-8"))
+
+        with self._lock:
+            self._file.write(member)
+            self._file.flush()
+
+    def close(self) -> None:
+        """ファイルを閉じる"""
+        with self._lock:
+            self._file.close()
+
+
+def load_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    記録ファイルを読み込む
+
+    書き込み中に強制終了したなどで末尾が壊れている場合は、そこまでの記録を返して終了する。
+
+    引数:
+        path (str): 記録ファイル
+
+    戻り値:
+        Iterator[Dict[str, Any]]: 記録された呼び出し（記録順）
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        while True:
+            try:
+                line = f.readline()
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                print(f"記録ファイルの末尾が壊れているため、以降を読み飛ばしました: {path}")
+                return
+            if not line:
+                return
+            if not line.endswith("\n"):
+                # 改行で終わらない行は書き込み途中の記録
+                print(f"記録ファイルの末尾が壊れているため、以降を読み飛ばしました: {path}")
+                return
+            if line.strip():
+                yield json.loads(line)
+
+
+_recorder: Optional[CallRecorder] = CallRecorder(LLM_RECORD_PATH) if LLM_RECORD_PATH else None
+
+
+def enable_recording(path: str) -> CallRecorder:
+    """
+    モデル呼び出しの記録を開始する
+
+    引数:
+        path (str): 記録先のファイル
+
+    戻り値:
+        CallRecorder: 記録クラス
+    """
+    global _recorder
+    disable_recording()
+    _recorder = CallRecorder(path)
+    return _recorder
+
+
+def disable_recording() -> None:
+    """モデル呼び出しの記録を終了する"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+
+# 正常終了時はファイルを閉じる（強制終了時も1件ごとに書き込み済みのため記録は失われない）
+atexit.register(disable_recording)
+
+
+def get_recorder() -> Optional[CallRecorder]:
+    """
+    有効な記録クラスを取得
+
+    戻り値:
+        Optional[CallRecorder]: 記録中であれば記録クラス、そうでなければNone
+    """
+    return _recorder
@@ -0,0 +1,276 @@
+"""
+記録済みのモデル呼び出しを再生するプロバイダー
+
+ネットワークを介さずに、記録された応答を決定的に返す
+"""
+from typing import Dict, List, Any, Optional, Sequence, Callable
+from collections import defaultdict
+import threading
+import time
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
+
+from models.base import BaseLanguageModel, to_langchain_messages
+from models.recording import load_records, serialize_messages, request_key
+from utils.cancellation import CancelToken
+from config import LLM_REPLAY_PATH, LLM_REPLAY_TIMING
+
+
+class ReplayStore:
+    """
+    記録ファイルから読み込んだ応答のストア
+
+    リクエストのキー（プロバイダー・モデル名・メッセージのハッシュ）で応答を引き、
+    同じキーの記録が複数ある場合は記録順に循環して返す。
+    """
+
+    def __init__(self, path: str, strict: bool = False, timing: bool = LLM_REPLAY_TIMING):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): 記録ファイル
+            strict (bool): Trueの場合、キーが一致しないリクエストはエラーにする。
+                Falseの場合は同じプロバイダーの記録を記録順に返す。
+            timing (bool): Trueの場合、記録時のレイテンシとチャンクのタイミングを再現する
+        """
+        self.path = path
+        self.strict = strict
+        self.timing = timing
+        self.records = list(load_records(path))
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_provider: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for record in self.records:
+            self._by_key[record["key"]].append(record)
+            self._by_provider[record["provider"]].append(record)
+        self._positions: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _next(self, name: str, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            record = candidates[self._positions[name] % len(candidates)]
+            self._positions[name] += 1
+        return record
+
+    def match(self, provider: str, model_name: str, langchain_messages: List[BaseMessage]) -> Dict[str, Any]:
+        """
+        リクエストに対応する記録を取得
+
+        引数:
+            provider (str): プロバイダー名
+            model_name (str): モデル名
+            langchain_messages (List[BaseMessage]): 送信されるメッセージ
+
+        戻り値:
+            Dict[str, Any]: 記録された呼び出し
+
+        例外:
+            KeyError: 対応する記録が見つからない場合
+        """
+        key = request_key(provider, model_name, serialize_messages(langchain_messages))
+        if key in self._by_key:
+            return self._next(key, self._by_key[key])
+        if self.strict or not self._by_provider.get(provider):
+            raise KeyError(f"記録された応答が見つかりません: provider={provider}, model={model_name}")
+        return self._next(provider, self._by_provider[provider])
+
+
+class ReplayModel(BaseLanguageModel):
+    """記録された応答を返すモデルのラッパークラス"""
+
+    def __init__(
+        self,
+        store: ReplayStore,
+        provider: str,
+        model_name: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ):
+        """
+        初期化メソッド
+
+        引数:
+            store (ReplayStore): 記録のストア
+            provider (str): 再生するプロバイダー名（"OpenAI" または "Google"）
+            model_name (str): 再生するモデル名
+            temperature (Optional[float]): モデル情報として返すtemperature
+            max_tokens (Optional[int]): モデル情報として返すmax_tokens
+        """
+        self.store = store
+        self.provider = provider
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def _invoke(
+        self,
+        runnable: Any,
+        langchain_messages: List[BaseMessage],
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> AIMessage:
+        """記録された応答を返す（ストリーミング時は記録されたチャンクを順に再生する）"""
+        started = time.perf_counter()
+        record = self.store.match(self.provider, self.model_name, langchain_messages)
+        response = record["response"]
+
+        if cancel_token is not None:
+            cancel_token.partial_response = ""
+            cancel_token.raise_if_cancelled()
+
+        if (cancel_token is not None or on_chunk is not None) and record.get("chunks"):
+            content = ""
+            for offset, delta in record["chunks"]:
+                if self.store.timing:
+                    time.sleep(max(0.0, started + offset - time.perf_counter()))
+                content += delta
+                if cancel_token is not None:
+                    cancel_token.partial_response = content
+                    cancel_token.raise_if_cancelled()
+                if on_chunk is not None:
+                    on_chunk(content)
+        elif self.store.timing:
+            time.sleep(max(0.0, started + record["latency"] - time.perf_counter()))
+
+        return AIMessage(
+            content=response["content"],
+            tool_calls=response["tool_calls"],
+            usage_metadata=response.get("usage"),
+        )
+
+    def generate(self, prompt: str, system_message: str = None, **kwargs) -> str:
+        """
+        テキスト生成
+
+        引数:
+            prompt (str): モデルへの入力プロンプト
+            system_message (str, optional): システムメッセージ
+            **kwargs: モデル固有の追加パラメータ
+
+        戻り値:
+            str: 記録されたテキスト
+        """
+        messages = []
+
+        # システムメッセージがある場合は追加
+        if system_message:
+            messages.append(SystemMessage(content=system_message))
+
+        # ユーザープロンプトを追加
+        messages.append(HumanMessage(content=prompt))
+
+        return self._invoke(None, messages).content
+
+    def generate_with_chat_history(
+        self,
+        messages: List[Dict[str, str]],
+        system_message: str = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[str] = None,
+        **kwargs,
+    ) -> str:
+        """
+        チャット履歴を考慮したテキスト生成
+
+        引数:
+            messages (List[Dict[str, str]]): チャットメッセージのリスト
+            system_message (str, optional): システムメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン
+            on_chunk (Optional[Callable[[str], None]]): ストリーミング中のコールバック
+            cache_key (Optional[str]): 変換済みメッセージのキャッシュのキー
+            **kwargs: モデル固有の追加パラメータ
+
+        戻り値:
+            str: 記録されたテキスト
+        """
+        langchain_messages = to_langchain_messages(messages, system_message, cache_key)
+
+        return self._invoke(None, langchain_messages, cancel_token, on_chunk).content
+
+    def generate_with_tools(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Sequence[Any],
+        system_message: str = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        cache_key: Optional[str] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        ツールを利用可能にしたテキスト生成（記録されたツール呼び出しをそのまま返す）
+
+        引数:
+            messages (List[Dict[str, Any]]): チャットメッセージのリスト
+            tools (Sequence[Any]): LangChainのツール（再生時は使用しない）
+            system_message (str, optional): システムメッセージ
+            cancel_token (Optional[CancelToken]): キャンセルトークン
+            on_chunk (Optional[Callable[[str], None]]): ストリーミング中のコールバック
+            cache_key (Optional[str]): 変換済みメッセージのキャッシュのキー
+            **kwargs: モデル固有の追加パラメータ
+
+        戻り値:
+            Dict[str, Any]: content、tool_calls、usage を含む辞書
+        """
+        response = self._invoke(None, to_langchain_messages(messages, system_message, cache_key), cancel_token, on_chunk)
+
+        return {
+            "content": response.content,
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"], "id": call["id"]}
+                for call in response.tool_calls
+            ],
+            "usage": response.usage_metadata,
+        }
+
+    def get_model_info(self) -> Dict[str, Any]:
+        """
+        モデル情報を取得
+
+        戻り値:
+            Dict[str, Any]: モデル情報を含む辞書
+        """
+        return {
+            "name": self.model_name,
+            "provider": self.provider,
+            "type": "Replay",
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+
+_replay_store: Optional[ReplayStore] = ReplayStore(LLM_REPLAY_PATH) if LLM_REPLAY_PATH else None
+
+
+def enable_replay(path: str, strict: bool = False, timing: bool = LLM_REPLAY_TIMING) -> ReplayStore:
+    """
+    記録された応答の再生を開始する（以降、グラフのノードはReplayModelを使用する）
+
+    引数:
+        path (str): 記録ファイル
+        strict (bool): キーが一致しないリクエストをエラーにする場合はTrue
+        timing (bool): 記録時のタイミングを再現する場合はTrue
+
+    戻り値:
+        ReplayStore: 記録のストア
+    """
+    global _replay_store
+    _replay_store = ReplayStore(path, strict=strict, timing=timing)
+    return _replay_store
+
+
+def disable_replay() -> None:
+    """記録された応答の再生を終了する"""
+    global _replay_store
+    _replay_store = None
+
+
+def get_replay_store() -> Optional[ReplayStore]:
+    """
+    有効な記録のストアを取得
+
+    戻り値:
+        Optional[ReplayStore]: 再生中であればストア、そうでなければNone
+    """
+    return _replay_store
@@ -0,0 +1 @@
+# スクリプトモジュール初期化ファイル
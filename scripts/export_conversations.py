@@ -0,0 +1,110 @@
+"""
+会話履歴の一括エクスポート・インポートCLI
+
+save_conversation_history で保存したJSONファイル群を列指向形式（Parquet、またはMessagePackのシャード）に
+まとめて書き出し、条件を指定して読み戻す。セッションIDにはファイル名（拡張子なし）を使用する。
+
+使用例:
+    # エクスポート
+    python -m scripts.export_conversations export histories/ --output conversations.parquet
+
+    # 条件を指定してJSONファイル群にインポート
+    python -m scripts.export_conversations import conversations.parquet --output-dir restored/ \
+        --filter "model == gpt-4o" --filter "turn_index < 10"
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+import argparse
+import os
+import re
+
+from scripts.ingest_documents import expand_paths
+from utils.conversation_export import (
+    COLUMNS,
+    INTEGER_COLUMNS,
+    FLOAT_COLUMNS,
+    ConversationExporter,
+    iter_conversations,
+)
+from utils.helpers import save_conversation_history, load_conversation_history
+from config import EXPORT_FORMAT, EXPORT_ROW_GROUP_SIZE
+
+
+FILTER_PATTERN = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>|not in|in)\s*(.+?)\s*$")
+
+
+def parse_filter(text: str) -> Tuple[str, str, Any]:
+    """
+    "列 演算子 値" 形式の条件を解析
+
+    in / not in の値はカンマ区切りで指定する。値は列の型に合わせて変換される。
+
+    引数:
+        text (str): 条件（例: "latency > 1.5"、"role in user,assistant"）
+
+    戻り値:
+        Tuple[str, str, Any]: read_batches に渡す条件
+
+    例外:
+        ValueError: 条件を解析できない場合
+    """
+    match = FILTER_PATTERN.match(text)
+    if match is None or match.group(1) not in COLUMNS:
+        raise ValueError(f"条件を解析できません: {text}")
+    column, op, value = match.groups()
+
+    def cast(item: str) -> Any:
+        if column in INTEGER_COLUMNS:
+            return int(item)
+        if column in FLOAT_COLUMNS:
+            return float(item)
+        return item
+
+    if op in ("in", "not in"):
+        return column, op, [cast(item.strip()) for item in value.split(",")]
+    return column, op, cast(value)
+
+
+def iter_history_files(paths: List[str]) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """JSONファイルを1つずつ読み込み、(セッションID, メッセージのリスト) を返す"""
+    for path in paths:
+        messages = load_conversation_history(path)
+        if messages is not None:
+            yield os.path.splitext(os.path.basename(path))[0], messages
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="会話履歴を列指向形式でエクスポート・インポートする")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="JSONファイル群を列指向形式に書き出す")
+    export_parser.add_argument("paths", nargs="+", help="JSONファイル、ディレクトリ、またはグロブパターン")
+    export_parser.add_argument("--output", required=True, help="出力先（Parquetはファイル、MessagePackはディレクトリ）")
+    export_parser.add_argument("--format", choices=["auto", "parquet", "msgpack"], default=EXPORT_FORMAT, help="保存形式")
+    export_parser.add_argument("--row-group-size", type=int, default=EXPORT_ROW_GROUP_SIZE, help="行グループ（シャード）の行数")
+
+    import_parser = subparsers.add_parser("import", help="列指向形式からJSONファイル群に読み戻す")
+    import_parser.add_argument("path", help="エクスポートの出力先")
+    import_parser.add_argument("--output-dir", required=True, help="JSONファイルの出力先ディレクトリ")
+    import_parser.add_argument("--filter", action="append", default=[], help="条件（例: \"role == assistant\"、複数指定はAND）")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        paths = [path for path in expand_paths(args.paths) if path.endswith(".json")]
+        with ConversationExporter(args.output, args.format, args.row_group_size) as exporter:
+            for session_id, messages in iter_history_files(paths):
+                exporter.add_session(session_id, messages)
+        print(f"{len(paths)} ファイル、{exporter.row_count} メッセージを {args.output} に書き出しました"
+              f"（形式: {exporter.export_format}）")
+    else:
+        filters = [parse_filter(text) for text in args.filter]
+        os.makedirs(args.output_dir, exist_ok=True)
+        count = 0
+        for session_id, messages in iter_conversations(args.path, filters):
+            save_conversation_history(messages, os.path.join(args.output_dir, f"{session_id}.json"))
+            count += 1
+        print(f"{count} セッションを {args.output_dir} に書き出しました")
+
+
+if __name__ == "__main__":
+    main()
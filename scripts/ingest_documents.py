@@ -0,0 +1,101 @@
+"""
+ドキュメント取り込みCLI
+
+ファイルをチャンクに分割して埋め込み、ベクトルストアに追加する
+
+使用例:
+    python -m scripts.ingest_documents docs/*.md
+    python -m scripts.ingest_documents --store vector_store --batch-size 64 manual.txt
+"""
+from typing import List
+import argparse
+import glob
+import os
+
+from utils.retrieval import chunk_text, embed_texts
+from utils.vector_store import VectorStore, HEADER_FILE
+from config import VECTOR_STORE_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+
+
+def expand_paths(patterns: List[str]) -> List[str]:
+    """
+    グロブパターンとディレクトリをファイルパスのリストに展開
+
+    引数:
+        patterns (List[str]): ファイルパス、ディレクトリ、またはグロブパターン
+
+    戻り値:
+        List[str]: ファイルパスのリスト
+    """
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    paths.extend(os.path.join(root, name) for name in sorted(files))
+            elif os.path.isfile(path):
+                paths.append(path)
+            else:
+                print(f"ファイルが見つかりません: {path}")
+    return paths
+
+
+def ingest_file(store_path: str, path: str, batch_size: int, chunk_size: int, overlap: int) -> int:
+    """
+    1つのファイルを取り込む
+
+    引数:
+        store_path (str): ベクトルストアのディレクトリ
+        path (str): 取り込むファイル
+        batch_size (int): 一度に埋め込むチャンク数
+        chunk_size (int): チャンクの最大文字数
+        overlap (int): チャンク間の重複文字数
+
+    戻り値:
+        int: 追加したチャンク数
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        chunks = chunk_text(f.read(), chunk_size=chunk_size, overlap=overlap)
+
+    store = None
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        vectors = embed_texts(batch)
+
+        # 次元数は最初の埋め込み結果から決定する
+        if store is None:
+            exists = os.path.exists(os.path.join(store_path, HEADER_FILE))
+            store = VectorStore(store_path, dim=None if exists else vectors.shape[1])
+
+        store.add(
+            vectors,
+            [
+                {"source": path, "chunk": start + i, "text": text}
+                for i, text in enumerate(batch)
+            ],
+        )
+
+    return len(chunks)
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="ドキュメントをベクトルストアに取り込む")
+    parser.add_argument("paths", nargs="+", help="取り込むファイル、ディレクトリ、またはグロブパターン")
+    parser.add_argument("--store", default=VECTOR_STORE_PATH, help="ベクトルストアのディレクトリ")
+    parser.add_argument("--batch-size", type=int, default=64, help="一度に埋め込むチャンク数")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="チャンクの最大文字数")
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP, help="チャンク間の重複文字数")
+    args = parser.parse_args()
+
+    total = 0
+    for path in expand_paths(args.paths):
+        count = ingest_file(args.store, path, args.batch_size, args.chunk_size, args.overlap)
+        print(f"{path}: {count} チャンクを追加しました")
+        total += count
+
+    print(f"合計 {total} チャンクを {args.store} に追加しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+グラフ実行のプロファイリングCLI
+
+記録済みのモデル呼び出しを再生して run_graph を実行し、ネットワークを除いた
+Python側のホットスポットを計測する
+
+使用例:
+    # 記録（アプリやスクリプトを記録モードで実行）
+    LLM_RECORD_PATH=calls.jsonl.gz streamlit run app.py
+
+    # cProfileで計測（.pstatsと上位関数の一覧を出力）
+    python -m scripts.profile_graph calls.jsonl.gz --mode cprofile --output profile
+
+    # サンプリングで計測（flamegraph.pl や speedscope で読める折り畳みスタックを出力）
+    python -m scripts.profile_graph calls.jsonl.gz --mode sample --output profile
+"""
+from typing import Dict, List, Any
+from collections import Counter
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+# プロファイリング中は埋め込みAPIへのアクセスを避けるため、検索拡張を無効にする
+os.environ.setdefault("RETRIEVAL_ENABLED", "0")
+
+from graph.builder import build_graph, run_graph
+from models.recording import load_records
+from models.replay import enable_replay
+
+
+ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+MODEL_TYPES = {"OpenAI": "chatgpt", "Google": "gemini"}
+
+
+def load_turns(path: str) -> List[Dict[str, Any]]:
+    """
+    記録からターンの開始（最後のメッセージがユーザー入力である呼び出し）を抽出
+
+    引数:
+        path (str): 記録ファイル
+
+    戻り値:
+        List[Dict[str, Any]]: run_graph の引数となる辞書のリスト
+    """
+    turns = []
+    for record in load_records(path):
+        messages = record["messages"]
+        if not messages or messages[-1]["type"] != "human":
+            continue
+
+        system_message = ""
+        if messages[0]["type"] == "system":
+            system_message = messages[0]["content"]
+            messages = messages[1:]
+
+        history = []
+        for message in messages[:-1]:
+            item = {"role": ROLES[message["type"]], "content": message["content"]}
+            for key in ("tool_calls", "tool_call_id", "name"):
+                if key in message:
+                    item[key] = message[key]
+            history.append(item)
+
+        turns.append({
+            "user_input": messages[-1]["content"],
+            "messages": history,
+            "system_message": system_message,
+            "current_model": MODEL_TYPES.get(record["provider"], "chatgpt"),
+        })
+    return turns
+
+
+class SamplingProfiler:
+    """
+    メインスレッドのスタックを一定間隔で採取するサンプリングプロファイラー
+
+    結果は折り畳みスタック形式（"関数;関数;関数 回数"）で出力される
+    """
+
+    def __init__(self, interval: float = 0.001):
+        """
+        初期化メソッド
+
+        引数:
+            interval (float): サンプリング間隔（秒）
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.relpath(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        """
+        折り畳みスタック形式で書き出す
+
+        引数:
+            path (str): 出力ファイル
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="記録済みの応答を再生してグラフ実行をプロファイリングする")
+    parser.add_argument("recording", help="記録ファイル（LLM_RECORD_PATHで作成した .jsonl.gz）")
+    parser.add_argument("--mode", choices=["cprofile", "sample"], default="cprofile", help="計測方法")
+    parser.add_argument("--output", default="profile", help="出力ファイルの接頭辞")
+    parser.add_argument("--repeat", type=int, default=1, help="コーパス全体を繰り返す回数")
+    parser.add_argument("--timing", action="store_true", help="記録時のレイテンシを再現する")
+    parser.add_argument("--interval", type=float, default=0.001, help="サンプリング間隔（秒、sampleモード）")
+    parser.add_argument("--top", type=int, default=30, help="表示する関数の数（cprofileモード）")
+    args = parser.parse_args()
+
+    enable_replay(args.recording, timing=args.timing)
+    turns = load_turns(args.recording)
+    graph = build_graph()
+    print(f"{len(turns)} ターン × {args.repeat} 回を再生します")
+
+    def workload():
+        for _ in range(args.repeat):
+            for turn in turns:
+                run_graph(
+                    graph,
+                    turn["user_input"],
+                    list(turn["messages"]),
+                    turn["system_message"],
+                    turn["current_model"],
+                )
+
+    start = time.perf_counter()
+    if args.mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.runcall(workload)
+        elapsed = time.perf_counter() - start
+
+        stats_path = f"{args.output}.pstats"
+        profiler.dump_stats(stats_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+        print(f"cProfileの結果を {stats_path} に保存しました（snakevizやgprof2dotで可視化できます）")
+    else:
+        with SamplingProfiler(args.interval) as profiler:
+            workload()
+        elapsed = time.perf_counter() - start
+
+        folded_path = f"{args.output}.folded"
+        profiler.write_folded(folded_path)
+        print(f"{sum(profiler.samples.values())} サンプルを {folded_path} に保存しました"
+              f"（flamegraph.pl や speedscope で可視化できます）")
+
+    total_turns = len(turns) * args.repeat
+    if total_turns:
+        print(f"合計 {elapsed:.3f} 秒（{elapsed * 1000 / total_turns:.2f} ミリ秒/ターン）")
+
+
+if __name__ == "__main__":
+    main()
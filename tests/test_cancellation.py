@@ -0,0 +1,125 @@
+"""
+生成のキャンセルのテスト
+
+応答の遅い偽のプロバイダーを使い、キャンセルが次のチャンクを待たずに反映され、
+ストリームが閉じられることを確認する
+"""
+from typing import Dict, List, Any
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from models.base import BaseLanguageModel
+from utils.cancellation import CancelToken, GenerationCancelled
+
+
+class SlowStream:
+    """一定間隔でチャンクを返す偽のチャットモデル"""
+
+    def __init__(self, interval: float, count: int = 100):
+        self.interval = interval
+        self.count = count
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def stream(self, messages):
+        try:
+            for i in range(self.count):
+                time.sleep(self.interval)
+                self.produced += 1
+                yield AIMessageChunk(content=f"{i} ")
+        finally:
+            self.closed.set()
+
+
+class FakeModel(BaseLanguageModel):
+    """_invokeを呼び出すだけのモデル"""
+
+    model_name = "fake"
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        raise NotImplementedError
+
+    def generate_with_chat_history(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        raise NotImplementedError
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {"name": self.model_name, "provider": "Fake", "type": "Fake"}
+
+
+def cancel_after(token: CancelToken, delay: float) -> None:
+    """別スレッドから一定時間後にキャンセルする"""
+    timer = threading.Timer(delay, token.cancel)
+    timer.daemon = True
+    timer.start()
+
+
+def test_cancel_while_provider_stalls_returns_immediately():
+    runnable = SlowStream(interval=2.0)
+    token = CancelToken()
+    cancel_after(token, 0.2)
+
+    started = time.perf_counter()
+    with pytest.raises(GenerationCancelled) as info:
+        FakeModel()._invoke(runnable, [HumanMessage(content="こんにちは")], token)
+
+    assert time.perf_counter() - started < 1.0
+    assert info.value.partial_response == ""
+
+    # 受信待ちのストリームは外部から閉じられないため、次のチャンクが届いた時点で閉じられる
+    assert not runnable.closed.is_set()
+    assert runnable.closed.wait(3.0)
+    assert runnable.produced == 1
+
+
+def test_stream_is_closed_after_cancel():
+    runnable = SlowStream(interval=0.1)
+    token = CancelToken()
+    cancel_after(token, 0.35)
+
+    with pytest.raises(GenerationCancelled) as info:
+        FakeModel()._invoke(runnable, [HumanMessage(content="こんにちは")], token)
+
+    assert info.value.partial_response.startswith("0 1 2")
+    assert runnable.closed.wait(1.0)
+    assert runnable.produced < 10
+
+
+def test_stream_is_closed_when_callback_raises():
+    runnable = SlowStream(interval=0.05)
+
+    def on_chunk(content: str) -> None:
+        raise RuntimeError("rerun")
+
+    with pytest.raises(RuntimeError):
+        FakeModel()._invoke(runnable, [HumanMessage(content="こんにちは")], on_chunk=on_chunk)
+
+    assert runnable.closed.wait(1.0)
+    assert runnable.produced < 5
+
+
+def test_partial_response_is_not_carried_over_between_calls():
+    token = CancelToken()
+    token.partial_response = "前の呼び出しの応答"
+    token.cancel()
+
+    with pytest.raises(GenerationCancelled) as info:
+        FakeModel()._invoke(SlowStream(interval=0.01), [HumanMessage(content="こんにちは")], token)
+
+    assert info.value.partial_response == ""
+
+
+def test_completed_stream_returns_full_response_on_caller_thread():
+    runnable = SlowStream(interval=0.01, count=3)
+    seen = []
+
+    def on_chunk(content: str) -> None:
+        seen.append((content, threading.current_thread() is threading.main_thread()))
+
+    response = FakeModel()._invoke(runnable, [HumanMessage(content="こんにちは")], CancelToken(), on_chunk)
+
+    assert response.content == "0 1 2 "
+    assert seen == [("0 ", True), ("0 1 ", True), ("0 1 2 ", True)]
+    assert runnable.closed.wait(1.0)
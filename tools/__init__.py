@@ -0,0 +1 @@
+# ツールモジュール初期化ファイル
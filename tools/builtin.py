@@ -0,0 +1,82 @@
+"""
+組み込みツール
+
+モデルから呼び出し可能なツールを定義
+"""
+from datetime import datetime
+import ast
+import operator
+
+from langchain_core.tools import tool
+
+from utils.retrieval import retrieve, format_context
+
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+# 巨大な整数の計算はGILを保持したまま実行され、タイムアウトでも止められないため、
+# 計算前にオペランドの大きさを制限する（結果が約3000桁を超える計算は拒否する）
+MAX_EXPONENT = 1000
+MAX_RESULT_BITS = 10_000
+
+
+def _check_operands(op: ast.operator, left: float, right: float) -> None:
+    """計算結果が大きくなりすぎる演算を事前に拒否する"""
+    if isinstance(op, ast.Pow):
+        if abs(right) > MAX_EXPONENT:
+            raise ValueError(f"指数が大きすぎます（上限 {MAX_EXPONENT}）")
+        if isinstance(left, int) and isinstance(right, int) and left.bit_length() * abs(right) > MAX_RESULT_BITS:
+            raise ValueError("計算結果が大きすぎます")
+    elif isinstance(op, ast.Mult):
+        if isinstance(left, int) and isinstance(right, int) and left.bit_length() + right.bit_length() > MAX_RESULT_BITS:
+            raise ValueError("計算結果が大きすぎます")
+
+
+def _evaluate(node: ast.AST) -> float:
+    """四則演算のみを許可した式の評価"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        _check_operands(node.op, left, right)
+        return _OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    raise ValueError(f"サポートされていない式です: {ast.dump(node)}")
+
+
+@tool
+def calculate(expression: str) -> str:
+    """数式（四則演算・べき乗・剰余）を計算して結果を返す。例: "(3 + 4) * 2" """
+    return str(_evaluate(ast.parse(expression, mode="eval")))
+
+
+@tool
+def get_current_time() -> str:
+    """現在の日時をISO 8601形式で返す。"""
+    return datetime.now().astimezone().isoformat()
+
+
+@tool
+def search_documents(query: str) -> str:
+    """取り込み済みの参考資料から、クエリに関連する箇所を検索して返す。"""
+    return format_context(retrieve(query)) or "該当する資料は見つかりませんでした。"
+
+
+# 現在時刻は呼び出しごとに結果が変わり、検索結果は資料の取り込みで変わるためキャッシュしない
+get_current_time.metadata = {"cacheable": False}
+search_documents.metadata = {"cacheable": False}
+
+DEFAULT_TOOLS = [calculate, get_current_time, search_documents]
@@ -0,0 +1,143 @@
+"""
+ツール実行モジュール
+
+モデルが1ステップで要求したツール呼び出しをスレッドプールで並列実行する
+"""
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+import json
+import threading
+import time
+
+from config import TOOL_TIMEOUT, TOOL_MAX_WORKERS, TOOL_CACHE_SIZE
+
+
+class ToolExecutor:
+    """
+    ツール呼び出しの並列実行クラス
+
+    ツールごとのタイムアウト、結果のキャッシュ、レイテンシの記録を行う。
+    タイムアウトしたツールにはエラーの結果を返すが、Pythonのスレッドは外部から停止できないため、
+    実行中のツールはワーカースレッド上で完了まで動き続ける。ツール側で処理量を制限すること。
+    """
+
+    def __init__(
+        self,
+        tools: Sequence[Any],
+        timeout: float = TOOL_TIMEOUT,
+        max_workers: int = TOOL_MAX_WORKERS,
+        cache_size: int = TOOL_CACHE_SIZE,
+    ):
+        """
+        初期化メソッド
+
+        引数:
+            tools (Sequence[Any]): LangChainのツール
+            timeout (float): ツール1回あたりの結果を待つ時間（秒）。実行中のツールは停止されない
+            max_workers (int): 並列実行するスレッド数
+            cache_size (int): キャッシュする結果の最大数
+        """
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, name: str, args: Dict[str, Any]) -> Optional[str]:
+        """キャッシュ可能なツールであればキャッシュキーを返す"""
+        tool = self.tools.get(name)
+        if tool is None or not (tool.metadata or {}).get("cacheable", True):
+            return None
+        return f"{name}:{json.dumps(args, sort_keys=True, ensure_ascii=False)}"
+
+    def _run_tool(self, name: str, args: Dict[str, Any]) -> Tuple[str, float]:
+        """ツールを1つ実行し、結果と実行時間を返す（ワーカースレッド上で実行される）"""
+        started = time.perf_counter()
+        result = str(self.tools[name].invoke(args))
+        return result, time.perf_counter() - started
+
+    def run(self, tool_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        ツール呼び出しを並列実行する
+
+        引数:
+            tool_calls (List[Dict[str, Any]]): name、args、idを含むツール呼び出しのリスト
+
+        戻り値:
+            Dict[str, Any]: messages（ツール結果のメッセージのリスト、呼び出し順）と
+                latencies（ツール名ごとの実行時間（秒）のリスト）を含む辞書
+        """
+        results: Dict[str, str] = {}
+        pending = []
+        latencies: Dict[str, List[float]] = {}
+
+        for call in tool_calls:
+            name, args = call["name"], call.get("args", {})
+            if name not in self.tools:
+                results[call["id"]] = f"エラー: 不明なツールです: {name}"
+                continue
+
+            key = self._cache_key(name, args)
+            if key is not None:
+                with self._lock:
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                        results[call["id"]] = self._cache[key]
+                        latencies.setdefault(name, []).append(0.0)
+                        continue
+
+            pending.append((call, key, time.perf_counter(), self._pool.submit(self._run_tool, name, args)))
+
+        # すべてのツールは同時に開始されているため、タイムアウトは各ツールの開始時刻から計測する
+        for call, key, started, future in pending:
+            name = call["name"]
+            remaining = max(0.0, started + self.timeout - time.perf_counter())
+            try:
+                result, elapsed = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                # 開始前であれば取り消されるが、実行中のツールは停止されない
+                future.cancel()
+                result = f"エラー: ツールがタイムアウトしました（{self.timeout}秒）: {name}"
+                elapsed = time.perf_counter() - started
+                key = None
+            except Exception as e:
+                result = f"エラー: ツールの実行に失敗しました: {name}: {e}"
+                elapsed = time.perf_counter() - started
+                key = None
+
+            latencies.setdefault(name, []).append(elapsed)
+            results[call["id"]] = result
+
+            if key is not None:
+                with self._lock:
+                    self._cache[key] = result
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        messages = [
+            {
+                "role": "tool",
+                "content": results[call["id"]],
+                "tool_call_id": call["id"],
+                "name": call["name"],
+            }
+            for call in tool_calls
+        ]
+
+        return {"messages": messages, "latencies": latencies}
+
+
+@lru_cache(maxsize=1)
+def get_tool_executor() -> ToolExecutor:
+    """
+    組み込みツールの実行クラスを取得（スレッドプールとキャッシュはプロセス内で共有）
+
+    戻り値:
+        ToolExecutor: ツール実行クラス
+    """
+    from tools.builtin import DEFAULT_TOOLS
+
+    return ToolExecutor(DEFAULT_TOOLS)
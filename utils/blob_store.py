@@ -0,0 +1,307 @@
+"""
+コンテンツアドレス型ブロブストア
+
+システムメッセージや長いメッセージ本文をSHA-256ハッシュで一度だけ保存し、
+会話履歴や状態のファイルには参照のみを記録する
+"""
+from typing import Dict, List, Any
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import os
+import threading
+
+from config import BLOB_STORE_PATH, BLOB_MIN_SIZE, INTERN_CACHE_SIZE, INTERN_CACHE_MAX_CHARS
+
+
+REF_KEY = "$ref"
+REF_PREFIX = "sha256:"
+
+
+class InternCache:
+    """
+    文字列のインターンキャッシュ
+
+    同じ内容の文字列に対して常に同じオブジェクトを返すことで、
+    セッション間でシステムメッセージなどをメモリ上で共有する
+    """
+
+    def __init__(self, max_size: int = INTERN_CACHE_SIZE, max_chars: int = INTERN_CACHE_MAX_CHARS):
+        """
+        初期化メソッド
+
+        引数:
+            max_size (int): 保持する文字列の最大数（超えた場合は古いものから破棄）
+            max_chars (int): 保持する文字列の合計文字数の上限（超えた場合は古いものから破棄）
+        """
+        self.max_size = max_size
+        self.max_chars = max_chars
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def intern(self, text: str) -> str:
+        """
+        文字列をインターンする
+
+        引数:
+            text (str): 対象の文字列
+
+        戻り値:
+            str: 同じ内容で共有される文字列オブジェクト
+        """
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+
+            # 上限を超える文字列は保持しない（共有されないだけで、呼び出し側の動作は変わらない）
+            if len(text) > self.max_chars:
+                return text
+
+            self._cache[text] = text
+            self._chars += len(text)
+            while len(self._cache) > self.max_size or self._chars > self.max_chars:
+                evicted, _ = self._cache.popitem(last=False)
+                self._chars -= len(evicted)
+            return text
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+_intern_cache = InternCache()
+
+
+def intern_text(text: str) -> str:
+    """
+    プロセス共有のキャッシュで文字列をインターンする
+
+    引数:
+        text (str): 対象の文字列
+
+    戻り値:
+        str: 同じ内容で共有される文字列オブジェクト
+    """
+    if not text:
+        return text
+    return _intern_cache.intern(text)
+
+
+class BlobStore:
+    """
+    ハッシュをキーとしたブロブストア
+
+    ブロブは `<path>/<ハッシュ先頭2文字>/<ハッシュ残り>` に保存され、同じ内容は一度だけ書き込まれる。
+    ディレクトリは最初の書き込み時に作成されるため、読み込みだけでは作成されない。
+    """
+
+    def __init__(self, path: str = BLOB_STORE_PATH):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): ストアのディレクトリ
+        """
+        self.path = path
+        # ブロブは不変のため、解決済みの内容をハッシュごとに保持しても整合性は崩れない
+        self._resolved: "OrderedDict[str, str]" = OrderedDict()
+        self._resolved_chars = 0
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def put(self, text: str) -> str:
+        """
+        文字列を保存する
+
+        引数:
+            text (str): 保存する文字列
+
+        戻り値:
+            str: 内容のハッシュ
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, blob_path)
+
+        return digest
+
+    def get(self, digest: str) -> str:
+        """
+        ハッシュから文字列を取得する
+
+        引数:
+            digest (str): 内容のハッシュ
+
+        戻り値:
+            str: インターンされた文字列
+        """
+        with self._lock:
+            text = self._resolved.get(digest)
+            if text is not None:
+                self._resolved.move_to_end(digest)
+                return text
+
+        with open(self._blob_path(digest), "rb") as f:
+            text = intern_text(f.read().decode("utf-8"))
+
+        with self._lock:
+            if digest not in self._resolved and len(text) <= INTERN_CACHE_MAX_CHARS:
+                self._resolved[digest] = text
+                self._resolved_chars += len(text)
+                while len(self._resolved) > INTERN_CACHE_SIZE or self._resolved_chars > INTERN_CACHE_MAX_CHARS:
+                    _, evicted = self._resolved.popitem(last=False)
+                    self._resolved_chars -= len(evicted)
+        return text
+
+    def make_ref(self, text: str) -> Dict[str, str]:
+        """
+        文字列を保存し、参照を返す
+
+        引数:
+            text (str): 保存する文字列
+
+        戻り値:
+            Dict[str, str]: `{"$ref": "sha256:<ハッシュ>"}` 形式の参照
+        """
+        return {REF_KEY: REF_PREFIX + self.put(text)}
+
+    def resolve(self, value: Any) -> Any:
+        """
+        参照であれば文字列に解決し、そうでなければそのまま返す
+
+        引数:
+            value (Any): 参照または値
+
+        戻り値:
+            Any: 解決された値
+        """
+        if is_ref(value):
+            return self.get(value[REF_KEY][len(REF_PREFIX):])
+        return value
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> BlobStore:
+    """
+    設定されたパスのブロブストアを取得（プロセス内で1つを共有）
+
+    戻り値:
+        BlobStore: ブロブストア
+    """
+    return BlobStore(BLOB_STORE_PATH)
+
+
+def is_ref(value: Any) -> bool:
+    """
+    値がブロブへの参照かどうかを判定
+
+    引数:
+        value (Any): 判定する値
+
+    戻り値:
+        bool: 参照の場合はTrue
+    """
+    return (
+        isinstance(value, dict)
+        and len(value) == 1
+        and isinstance(value.get(REF_KEY), str)
+        and value[REF_KEY].startswith(REF_PREFIX)
+    )
+
+
+def dehydrate_messages(
+    messages: List[Dict[str, Any]],
+    store: BlobStore,
+    min_size: int = BLOB_MIN_SIZE,
+) -> List[Dict[str, Any]]:
+    """
+    一定以上の長さのメッセージ本文をブロブストアに移し、参照に置き換える
+
+    引数:
+        messages (List[Dict[str, Any]]): メッセージのリスト
+        store (BlobStore): ブロブストア
+        min_size (int): ブロブに移す本文の最小文字数
+
+    戻り値:
+        List[Dict[str, Any]]: 本文が参照に置き換えられたメッセージのリスト
+    """
+    dehydrated = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str) and len(content) >= min_size:
+            message = {**message, "content": store.make_ref(content)}
+        dehydrated.append(message)
+    return dehydrated
+
+
+def hydrate_messages(messages: List[Dict[str, Any]], store: BlobStore) -> List[Dict[str, Any]]:
+    """
+    参照に置き換えられたメッセージ本文を復元する
+
+    引数:
+        messages (List[Dict[str, Any]]): メッセージのリスト
+        store (BlobStore): ブロブストア
+
+    戻り値:
+        List[Dict[str, Any]]: 本文が復元されたメッセージのリスト
+    """
+    hydrated = []
+    for message in messages:
+        if is_ref(message.get("content")):
+            message = {**message, "content": store.resolve(message["content"])}
+        hydrated.append(message)
+    return hydrated
+
+
+def dehydrate_state(
+    state: Dict[str, Any],
+    store: BlobStore,
+    min_size: int = BLOB_MIN_SIZE,
+) -> Dict[str, Any]:
+    """
+    グラフ状態のシステムメッセージとメッセージ本文を参照に置き換える
+
+    引数:
+        state (Dict[str, Any]): グラフ状態
+        store (BlobStore): ブロブストア
+        min_size (int): ブロブに移すメッセージ本文の最小文字数
+
+    戻り値:
+        Dict[str, Any]: 参照に置き換えられた状態
+    """
+    dehydrated = dict(state)
+    if state.get("system_message"):
+        dehydrated["system_message"] = store.make_ref(state["system_message"])
+    if state.get("messages"):
+        dehydrated["messages"] = dehydrate_messages(state["messages"], store, min_size)
+    return dehydrated
+
+
+def hydrate_state(state: Dict[str, Any], store: BlobStore) -> Dict[str, Any]:
+    """
+    参照に置き換えられたグラフ状態を復元する
+
+    引数:
+        state (Dict[str, Any]): 参照を含むグラフ状態
+        store (BlobStore): ブロブストア
+
+    戻り値:
+        Dict[str, Any]: 復元された状態
+    """
+    hydrated = dict(state)
+    if "system_message" in state:
+        hydrated["system_message"] = store.resolve(state["system_message"])
+    if state.get("messages"):
+        hydrated["messages"] = hydrate_messages(state["messages"], store)
+    return hydrated
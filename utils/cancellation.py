@@ -0,0 +1,137 @@
+"""
+協調的キャンセルモジュール
+
+セッションごとのキャンセルトークンを管理し、実行中の生成を途中で停止できるようにする
+"""
+from typing import Dict, List, Any, Optional, Callable
+import threading
+
+
+class GenerationCancelled(Exception):
+    """生成がキャンセルされたことを示す例外"""
+
+    def __init__(self, partial_response: str = ""):
+        """
+        初期化メソッド
+
+        引数:
+            partial_response (str): キャンセルまでに生成された応答
+        """
+        super().__init__("生成がキャンセルされました")
+        self.partial_response = partial_response
+
+
+class CancelToken:
+    """
+    キャンセルトークン
+
+    グラフとモデルラッパーはストリーミングのチャンクごとにトークンを確認し、
+    キャンセルされていれば処理を打ち切る。チャンクを待っている処理は、コールバックにより
+    次のチャンクの到着を待たずにキャンセルを受け取る。
+    """
+
+    def __init__(self):
+        """初期化メソッド"""
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        # ストリーミング中に受信済みの応答（中断時に履歴へ残すため）
+        self.partial_response = ""
+
+    def cancel(self) -> None:
+        """キャンセルを要求する（登録されたコールバックはこのスレッドで呼び出される）"""
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        キャンセル時に呼び出すコールバックを登録する
+
+        すでにキャンセルされている場合は即座に呼び出される。
+
+        引数:
+            callback (Callable[[], None]): キャンセル時に呼び出す関数
+
+        戻り値:
+            Callable[[], None]: 登録を解除する関数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @property
+    def cancelled(self) -> bool:
+        """キャンセルが要求されている場合はTrue"""
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """
+        キャンセルが要求されていれば例外を送出する
+
+        例外:
+            GenerationCancelled: キャンセルが要求されている場合
+        """
+        if self.cancelled:
+            raise GenerationCancelled(self.partial_response)
+
+
+_tokens: Dict[str, CancelToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def new_cancel_token(session_id: str) -> CancelToken:
+    """
+    セッションの新しいキャンセルトークンを発行する
+
+    同じセッションで実行中の生成があれば、そのトークンはキャンセルされる
+
+    引数:
+        session_id (str): セッションID
+
+    戻り値:
+        CancelToken: 新しいキャンセルトークン
+    """
+    token = CancelToken()
+    with _tokens_lock:
+        previous = _tokens.get(session_id)
+        _tokens[session_id] = token
+    if previous is not None:
+        previous.cancel()
+    return token
+
+
+def cancel_session(session_id: str) -> None:
+    """
+    セッションで実行中の生成をキャンセルする
+
+    引数:
+        session_id (str): セッションID
+    """
+    with _tokens_lock:
+        token = _tokens.get(session_id)
+    if token is not None:
+        token.cancel()
+
+
+def get_cancel_token(config: Optional[Dict[str, Any]]) -> Optional[CancelToken]:
+    """
+    グラフの実行設定からキャンセルトークンを取り出す
+
+    引数:
+        config (Optional[Dict[str, Any]]): LangGraphの実行設定
+
+    戻り値:
+        Optional[CancelToken]: キャンセルトークン。設定されていない場合はNone。
+    """
+    return ((config or {}).get("configurable") or {}).get("cancel_token")
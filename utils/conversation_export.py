@@ -0,0 +1,503 @@
+"""
+会話履歴の一括エクスポート・インポート
+
+多数の会話をメッセージ単位の行として列指向形式で保存する。pyarrowがあればParquet、
+なければ列ごとにzlib圧縮したMessagePackのシャードと、シャードごとの統計を持つマニフェストで保存する。
+書き込みは一定行数ごとに行われるため、全体をメモリに載せる必要はない。
+読み込み時は列と条件を指定でき、Parquetは行グループの統計、MessagePackはマニフェストの統計によって
+条件に該当しないブロックを読み飛ばす。
+"""
+from typing import Dict, List, Any, Optional, Iterator, Iterable, Sequence, Tuple
+import importlib.util
+import json
+import operator
+import os
+import zlib
+
+from utils.blob_store import BlobStore, get_blob_store, is_ref, hydrate_messages
+from config import EXPORT_FORMAT, EXPORT_ROW_GROUP_SIZE, EXPORT_COMPRESSION
+
+
+COLUMNS = [
+    "session_id",
+    "message_index",
+    "turn_index",
+    "role",
+    "model",
+    "content",
+    "latency",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "tool_calls",
+    "tool_call_id",
+    "name",
+]
+INTEGER_COLUMNS = {"message_index", "turn_index", "input_tokens", "output_tokens", "total_tokens"}
+FLOAT_COLUMNS = {"latency"}
+# 統計を持たない（条件の対象としない）列
+UNINDEXED_COLUMNS = {"content", "tool_calls"}
+
+MANIFEST_FILE = "manifest.json"
+SHARD_SUFFIX = ".msgpack"
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+Filter = Tuple[str, str, Any]
+
+
+def resolve_format(export_format: str = EXPORT_FORMAT) -> str:
+    """
+    使用する保存形式を決定
+
+    引数:
+        export_format (str): "parquet"、"msgpack"、または "auto"（pyarrowがあればparquet）
+
+    戻り値:
+        str: "parquet" または "msgpack"
+
+    例外:
+        ValueError: 不明な形式が指定された場合
+        ImportError: 必要なライブラリがインストールされていない場合
+    """
+    if export_format not in ("auto", "parquet", "msgpack"):
+        raise ValueError(f"不明な形式です: {export_format}")
+
+    candidates = ["parquet", "msgpack"] if export_format == "auto" else [export_format]
+    for candidate in candidates:
+        module = "pyarrow" if candidate == "parquet" else "msgpack"
+        if importlib.util.find_spec(module) is not None:
+            return candidate
+
+    raise ImportError("列指向形式での保存には pyarrow または msgpack が必要です（pip install pyarrow）")
+
+
+def _parquet_schema():
+    """Parquetのスキーマ"""
+    import pyarrow as pa
+
+    types = {column: pa.string() for column in COLUMNS}
+    types.update({column: pa.int32() for column in INTEGER_COLUMNS})
+    types.update({column: pa.float64() for column in FLOAT_COLUMNS})
+    return pa.schema([(column, types[column]) for column in COLUMNS])
+
+
+def iter_message_rows(session_id: str, messages: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    会話のメッセージを行に変換
+
+    ターン番号はユーザーメッセージごとに1つ進む（ツール呼び出しやその結果は同じターンに含まれる）。
+
+    引数:
+        session_id (str): セッションID
+        messages (List[Dict[str, Any]]): メッセージのリスト
+
+    戻り値:
+        Iterator[Dict[str, Any]]: COLUMNSをキーとする行
+    """
+    turn_index = 0
+    seen_user = False
+    for message_index, message in enumerate(messages):
+        role = message.get("role", "")
+        if role == "user":
+            if seen_user:
+                turn_index += 1
+            seen_user = True
+
+        usage = message.get("usage") or {}
+        tool_calls = message.get("tool_calls")
+        yield {
+            "session_id": session_id,
+            "message_index": message_index,
+            "turn_index": turn_index,
+            "role": role,
+            "model": message.get("model"),
+            "content": message.get("content", ""),
+            "latency": message.get("latency"),
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+            "tool_calls": json.dumps(tool_calls, ensure_ascii=False) if tool_calls else None,
+            "tool_call_id": message.get("tool_call_id"),
+            "name": message.get("name"),
+        }
+
+
+def row_to_message(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    行をメッセージに戻す
+
+    引数:
+        row (Dict[str, Any]): COLUMNSのすべてをキーとする行
+
+    戻り値:
+        Dict[str, Any]: メッセージ（ノードが記録したmodel・latency・usageを含む）
+    """
+    message = {"role": row["role"], "content": row["content"]}
+    if row["tool_calls"]:
+        message["tool_calls"] = json.loads(row["tool_calls"])
+    if row["tool_call_id"]:
+        message["tool_call_id"] = row["tool_call_id"]
+        message["name"] = row["name"]
+    if row["model"] is not None:
+        input_tokens, output_tokens, total_tokens = row["input_tokens"], row["output_tokens"], row["total_tokens"]
+        message["model"] = row["model"]
+        message["latency"] = row["latency"]
+        if input_tokens is None and output_tokens is None and total_tokens is None:
+            message["usage"] = None
+        else:
+            message["usage"] = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": total_tokens,
+            }
+    return message
+
+
+class ConversationExporter:
+    """
+    会話を列指向形式で書き出すクラス
+
+    行はrow_group_size行ごとにParquetの行グループ、またはMessagePackのシャードとして書き出される。
+    Parquetの場合pathはファイル、MessagePackの場合pathはディレクトリになる。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        export_format: str = EXPORT_FORMAT,
+        row_group_size: int = EXPORT_ROW_GROUP_SIZE,
+        compression: str = EXPORT_COMPRESSION,
+        blob_store: Optional[BlobStore] = None,
+    ):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): 出力先（Parquetはファイル、MessagePackはディレクトリ）
+            export_format (str): "parquet"、"msgpack"、または "auto"
+            row_group_size (int): 1つの行グループ（シャード）の行数
+            compression (str): Parquetの圧縮方式
+            blob_store (Optional[BlobStore]): 参照を含むメッセージを解決するブロブストア（省略時はデフォルトのストア）
+        """
+        self.path = path
+        self.export_format = resolve_format(export_format)
+        self.row_group_size = row_group_size
+        self.blob_store = blob_store
+        self.row_count = 0
+        self._buffer: Dict[str, List[Any]] = {column: [] for column in COLUMNS}
+        self._buffered = 0
+
+        if self.export_format == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, _parquet_schema(), compression=compression)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._shards: List[Dict[str, Any]] = []
+
+    def add_session(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        1つの会話を追加する
+
+        引数:
+            session_id (str): セッションID
+            messages (List[Dict[str, Any]]): メッセージのリスト（ブロブストアの参照を含んでもよい）
+        """
+        if any(is_ref(message.get("content")) for message in messages):
+            messages = hydrate_messages(messages, self.blob_store or get_blob_store())
+
+        for row in iter_message_rows(session_id, messages):
+            for column in COLUMNS:
+                self._buffer[column].append(row[column])
+            self._buffered += 1
+            if self._buffered >= self.row_group_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        """バッファの行を書き出す"""
+        if not self._buffered:
+            return
+
+        if self.export_format == "parquet":
+            import pyarrow as pa
+
+            self._writer.write_table(pa.Table.from_pydict(self._buffer, schema=self._writer.schema))
+        else:
+            self._write_shard()
+
+        self.row_count += self._buffered
+        self._buffer = {column: [] for column in COLUMNS}
+        self._buffered = 0
+
+    def _write_shard(self) -> None:
+        """バッファの行をMessagePackのシャードとして書き出し、統計をマニフェストに追加する"""
+        import msgpack
+
+        # 列ごとに圧縮し、読み込み時に必要な列だけを展開できるようにする
+        columns = {
+            column: zlib.compress(msgpack.packb(values, use_bin_type=True), 6)
+            for column, values in self._buffer.items()
+        }
+        filename = f"part-{len(self._shards):05d}{SHARD_SUFFIX}"
+        with open(os.path.join(self.path, filename), "wb") as f:
+            f.write(msgpack.packb(columns, use_bin_type=True))
+
+        stats = {}
+        for column, values in self._buffer.items():
+            if column in UNINDEXED_COLUMNS:
+                continue
+            present = [value for value in values if value is not None]
+            if present:
+                stats[column] = [min(present), max(present)]
+        self._shards.append({"file": filename, "rows": self._buffered, "stats": stats})
+
+    def close(self) -> None:
+        """残りの行を書き出してファイルを閉じる"""
+        self._flush()
+        if self.export_format == "parquet":
+            self._writer.close()
+        else:
+            # マニフェストは最後に書き換えるため、書き込み途中のシャードが読まれることはない
+            manifest_path = os.path.join(self.path, MANIFEST_FILE)
+            with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"columns": COLUMNS, "rows": self.row_count, "shards": self._shards}, f, ensure_ascii=False)
+            os.replace(manifest_path + ".tmp", manifest_path)
+
+    def abort(self) -> None:
+        """書き出しを中止し、途中まで書き出した出力を削除する（マニフェストは書き出さない）"""
+        if self.export_format == "parquet":
+            self._writer.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            for shard in self._shards:
+                shard_path = os.path.join(self.path, shard["file"])
+                if os.path.exists(shard_path):
+                    os.remove(shard_path)
+            try:
+                # 既存のファイルがあるディレクトリは残す
+                os.rmdir(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "ConversationExporter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # 例外で中断された場合は、不完全な出力が完全なものとして読まれないように削除する
+        if exc_info[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def export_conversations(
+    sessions: Iterable[Tuple[str, List[Dict[str, Any]]]],
+    path: str,
+    export_format: str = EXPORT_FORMAT,
+    row_group_size: int = EXPORT_ROW_GROUP_SIZE,
+) -> int:
+    """
+    会話をまとめて書き出す
+
+    引数:
+        sessions (Iterable[Tuple[str, List[Dict[str, Any]]]]): (セッションID, メッセージのリスト) の列（ジェネレーター可）
+        path (str): 出力先
+        export_format (str): "parquet"、"msgpack"、または "auto"
+        row_group_size (int): 1つの行グループ（シャード）の行数
+
+    戻り値:
+        int: 書き出した行（メッセージ）数
+    """
+    with ConversationExporter(path, export_format, row_group_size) as exporter:
+        for session_id, messages in sessions:
+            exporter.add_session(session_id, messages)
+    return exporter.row_count
+
+
+def _validate_filters(filters: Optional[Sequence[Filter]]) -> List[Filter]:
+    """条件を検証する"""
+    filters = list(filters or [])
+    for column, op, _ in filters:
+        if column not in COLUMNS:
+            raise ValueError(f"不明な列です: {column}")
+        if column in UNINDEXED_COLUMNS:
+            raise ValueError(f"この列は条件に指定できません: {column}")
+        if op not in OPERATORS and op not in ("in", "not in"):
+            raise ValueError(f"不明な演算子です: {op}")
+    return filters
+
+
+def _to_expression(filters: List[Filter]):
+    """条件をpyarrowの式に変換（すべての条件のAND）"""
+    import pyarrow.dataset as ds
+
+    expression = None
+    for column, op, value in filters:
+        field = ds.field(column)
+        if op == "in":
+            term = field.isin(list(value))
+        elif op == "not in":
+            term = ~field.isin(list(value))
+        else:
+            term = OPERATORS[op](field, value)
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def _shard_may_match(stats: Dict[str, List[Any]], filters: List[Filter]) -> bool:
+    """シャードの統計から、条件に一致する行が含まれうるかを判定"""
+    for column, op, value in filters:
+        bounds = stats.get(column)
+        if bounds is None:
+            # すべてNULLの列はnot in以外の条件に一致しない
+            if op != "not in":
+                return False
+            continue
+
+        low, high = bounds
+        if op == "==" and not low <= value <= high:
+            return False
+        if op == "!=" and low == high == value:
+            return False
+        if op == "<" and not low < value:
+            return False
+        if op == "<=" and not low <= value:
+            return False
+        if op == ">" and not high > value:
+            return False
+        if op == ">=" and not high >= value:
+            return False
+        if op == "in" and not any(low <= item <= high for item in value):
+            return False
+    return True
+
+
+def _row_matches(value: Any, op: str, operand: Any) -> bool:
+    """1つの値が条件に一致するか（NULLはnot in以外に一致しない、pyarrowと同じ扱い）"""
+    if op == "not in":
+        return value not in operand
+    if value is None:
+        return False
+    if op == "in":
+        return value in operand
+    return OPERATORS[op](value, operand)
+
+
+def _read_msgpack_batches(
+    path: str,
+    columns: List[str],
+    filters: List[Filter],
+) -> Iterator[Dict[str, List[Any]]]:
+    """MessagePackのシャードを読み込む"""
+    import msgpack
+
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    needed = set(columns) | {column for column, _, _ in filters}
+    for shard in manifest["shards"]:
+        if not _shard_may_match(shard["stats"], filters):
+            continue
+
+        with open(os.path.join(path, shard["file"]), "rb") as f:
+            packed = msgpack.unpackb(f.read(), raw=False)
+        data = {
+            column: msgpack.unpackb(zlib.decompress(packed[column]), raw=False)
+            for column in needed
+        }
+
+        if filters:
+            selected = [
+                i for i in range(shard["rows"])
+                if all(_row_matches(data[column][i], op, value) for column, op, value in filters)
+            ]
+            if not selected:
+                continue
+            if len(selected) < shard["rows"]:
+                data = {column: [data[column][i] for i in selected] for column in columns}
+
+        yield {column: data[column] for column in columns}
+
+
+def read_batches(
+    path: str,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Sequence[Filter]] = None,
+    batch_size: int = EXPORT_ROW_GROUP_SIZE,
+) -> Iterator[Dict[str, List[Any]]]:
+    """
+    書き出した会話を列ごとのバッチとして読み込む
+
+    条件に一致しない行グループ・シャードは読み飛ばされ、指定した列以外は展開されない。
+
+    引数:
+        path (str): ConversationExporterの出力先
+        columns (Optional[Sequence[str]]): 読み込む列（省略時はすべての列）
+        filters (Optional[Sequence[Filter]]): (列, 演算子, 値) の条件のリスト（AND）。
+            演算子は ==、!=、<、<=、>、>=、in、not in。例: [("role", "==", "assistant"), ("latency", ">", 1.0)]
+        batch_size (int): Parquetの場合の1バッチの最大行数
+
+    戻り値:
+        Iterator[Dict[str, List[Any]]]: 列名をキーとし、値のリストを持つ辞書（書き出した順）
+
+    例外:
+        ValueError: 不明な列・演算子が指定された場合
+    """
+    columns = list(columns or COLUMNS)
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"不明な列です: {', '.join(unknown)}")
+    filters = _validate_filters(filters)
+
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        yield from _read_msgpack_batches(path, columns, filters)
+        return
+
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet")
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=_to_expression(filters) if filters else None,
+        batch_size=batch_size,
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pydict()
+
+
+def iter_conversations(
+    path: str,
+    filters: Optional[Sequence[Filter]] = None,
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    書き出した会話をセッションごとのメッセージのリストとして読み込む
+
+    引数:
+        path (str): ConversationExporterの出力先
+        filters (Optional[Sequence[Filter]]): read_batchesと同じ条件（一致したメッセージのみが含まれる）
+
+    戻り値:
+        Iterator[Tuple[str, List[Dict[str, Any]]]]: (セッションID, メッセージのリスト)
+    """
+    session_id, messages = None, []
+    for batch in read_batches(path, filters=filters):
+        for values in zip(*(batch[column] for column in COLUMNS)):
+            row = dict(zip(COLUMNS, values))
+            if row["session_id"] != session_id:
+                if session_id is not None:
+                    yield session_id, messages
+                session_id, messages = row["session_id"], []
+            messages.append(row_to_message(row))
+
+    if session_id is not None:
+        yield session_id, messages
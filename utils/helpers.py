@@ -4,6 +4,9 @@
 from typing import Dict, List, Any, Optional
 import json
 
+from utils.blob_store import BlobStore, get_blob_store, dehydrate_messages, hydrate_messages, is_ref
+from config import BLOB_STORE_ENABLED
+
 
 def format_messages_for_display(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
     """
@@ -23,7 +26,7 @@ def format_messages_for_display(messages: List[Dict[str, str]]) -> List[Dict[str
         
         if role == "user":
             formatted_messages.append({"is_user": True, "content": content})
-        elif role == "assistant":
+        elif role == "assistant" and not message.get("tool_calls"):
             formatted_messages.append({"is_user": False, "content": content})
     
     return formatted_messages
@@ -48,27 +51,82 @@ def determine_next_model(state: Dict[str, Any]) -> str:
         return "chatgpt"
 
 
-def save_conversation_history(messages: List[Dict[str, str]], filename: str) -> None:
+def conversion_cache_key(session_id: str, model_type: str) -> str:
+    """
+    変換済みメッセージのキャッシュのキーを作成
+
+    引数:
+        session_id (str): セッションID
+        model_type (str): モデルの種類 ("chatgpt" または "gemini")
+
+    戻り値:
+        str: キャッシュのキー
+    """
+    return f"{session_id}:{model_type}"
+
+
+def attach_context(messages: List[Dict[str, Any]], context: str = "") -> List[Dict[str, Any]]:
+    """
+    検索したコンテキストを最後のユーザーメッセージに付加する
+
+    システムメッセージではなく最後のユーザーメッセージに付加することで、システムメッセージと
+    それまでの履歴はターンをまたいで変わらず、プロバイダーのプロンプトキャッシュと先読みが有効になる。
+    履歴自体は変更せず、モデルに送信するためのリストを返す。
+
+    引数:
+        messages (List[Dict[str, Any]]): チャットメッセージのリスト
+        context (str): 検索されたドキュメントのチャンク
+
+    戻り値:
+        List[Dict[str, Any]]: モデルに送信するメッセージのリスト
+    """
+    if not context:
+        return messages
+
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index]["role"] == "user":
+            message = messages[index]
+            content = f"以下の参考資料を必要に応じて回答に利用してください。\n\n{context}\n\n{message['content']}"
+            return messages[:index] + [{**message, "content": content}] + messages[index + 1:]
+    return messages
+
+
+def save_conversation_history(
+    messages: List[Dict[str, str]],
+    filename: str,
+    blob_store: Optional[BlobStore] = None,
+) -> None:
     """
     会話履歴をJSONファイルに保存
 
     引数:
         messages (List[Dict[str, str]]): 保存するメッセージのリスト
         filename (str): 保存先のファイル名
+        blob_store (Optional[BlobStore]): 長いメッセージ本文を保存するブロブストア。省略時は
+            BLOB_STORE_ENABLED が有効であれば設定されたストア（BLOB_STORE_PATH）を使用し、
+            無効であればすべての本文をファイルに直接記録する
     """
     try:
+        if blob_store is None and BLOB_STORE_ENABLED:
+            blob_store = get_blob_store()
+        if blob_store is not None:
+            messages = dehydrate_messages(messages, blob_store)
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(messages, f, ensure_ascii=False, indent=2)
     except Exception as e:
         print(f"会話履歴の保存中にエラーが発生しました: {e}")
 
 
-def load_conversation_history(filename: str) -> Optional[List[Dict[str, str]]]:
+def load_conversation_history(
+    filename: str,
+    blob_store: Optional[BlobStore] = None,
+) -> Optional[List[Dict[str, str]]]:
     """
     JSONファイルから会話履歴を読み込み
 
     引数:
         filename (str): 読み込むファイル名
+        blob_store (Optional[BlobStore]): 参照を解決するブロブストア（省略時はデフォルトのストア）
 
     戻り値:
         Optional[List[Dict[str, str]]]: 読み込まれたメッセージのリスト。
@@ -76,7 +134,7 @@ def load_conversation_history(filename: str) -> Optional[List[Dict[str, str]]]:
     """
     try:
         with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            messages = json.load(f)
     except FileNotFoundError:
         print(f"ファイルが見つかりません: {filename}")
         return None
@@ -86,3 +144,15 @@ def load_conversation_history(filename: str) -> Optional[List[Dict[str, str]]]:
     except Exception as e:
         print(f"会話履歴の読み込み中にエラーが発生しました: {e}")
         return None
+
+    try:
+        if any(is_ref(message.get("content")) for message in messages):
+            messages = hydrate_messages(messages, blob_store or get_blob_store())
+        return messages
+    except FileNotFoundError as e:
+        # 履歴ファイルは存在するが、参照先のブロブがストアにない（BLOB_STORE_PATH の設定違いなど）
+        print(f"参照先のブロブが見つかりません: {e.filename}（履歴ファイル: {filename}）")
+        return None
+    except Exception as e:
+        print(f"会話履歴の読み込み中にエラーが発生しました: {e}")
+        return None
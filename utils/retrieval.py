@@ -0,0 +1,160 @@
+"""
+検索拡張（RAG）モジュール
+
+ドキュメントのチャンク分割、埋め込み、ベクトルストアからの検索を担当
+"""
+from typing import Dict, List, Any, Optional
+from functools import lru_cache
+import os
+
+import numpy as np
+
+from utils.vector_store import VectorStore, HEADER_FILE
+from config import (
+    OPENAI_API_KEY,
+    RETRIEVAL_ENABLED,
+    EMBEDDING_MODEL,
+    VECTOR_STORE_PATH,
+    RETRIEVAL_TOP_K,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+)
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    テキストを重複付きのチャンクに分割
+
+    できるだけ段落・改行の境界で区切り、境界が見つからない場合は文字数で区切る。
+
+    引数:
+        text (str): 分割するテキスト
+        chunk_size (int): チャンクの最大文字数
+        overlap (int): 隣接するチャンク間で重複させる文字数
+
+    戻り値:
+        List[str]: チャンクのリスト
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # チャンクの後半にある段落・改行の境界を優先する
+            for separator in ("\n\n", "\n", "。", ". "):
+                boundary = text.rfind(separator, start + chunk_size // 2, end)
+                if boundary != -1:
+                    end = boundary + len(separator)
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+    return chunks
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """
+    埋め込みモデルを取得（プロセス内で1つを共有）
+
+    戻り値:
+        OpenAIEmbeddings: LangChainの埋め込みモデル
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    テキストのリストをまとめて埋め込む
+
+    引数:
+        texts (List[str]): 埋め込むテキスト
+
+    戻り値:
+        np.ndarray: 形状 (len(texts), dim) の埋め込みベクトル
+    """
+    return np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    検索クエリを埋め込む
+
+    引数:
+        query (str): 検索クエリ
+
+    戻り値:
+        np.ndarray: 形状 (dim,) の埋め込みベクトル
+    """
+    return np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def _open_vector_store(path: str) -> VectorStore:
+    return VectorStore(path)
+
+
+def get_vector_store(path: str = VECTOR_STORE_PATH) -> Optional[VectorStore]:
+    """
+    ベクトルストアを取得
+
+    ストアは一度だけメモリマップされ、以降は他プロセスによる追加があった場合のみ再マップされる。
+
+    引数:
+        path (str): ストアのディレクトリ
+
+    戻り値:
+        Optional[VectorStore]: ベクトルストア。存在しない場合はNone。
+    """
+    if not os.path.exists(os.path.join(path, HEADER_FILE)):
+        return None
+    store = _open_vector_store(path)
+    store.refresh()
+    return store
+
+
+def retrieve(query: str, k: int = RETRIEVAL_TOP_K, path: str = VECTOR_STORE_PATH) -> List[Dict[str, Any]]:
+    """
+    クエリに関連するチャンクを検索
+
+    引数:
+        query (str): 検索クエリ
+        k (int): 返すチャンク数
+        path (str): ストアのディレクトリ
+
+    戻り値:
+        List[Dict[str, Any]]: スコア付きのチャンクメタデータ（スコア降順）
+    """
+    if not RETRIEVAL_ENABLED:
+        return []
+
+    store = get_vector_store(path)
+    if store is None or len(store) == 0 or not query.strip():
+        return []
+
+    results = store.search(embed_query(query), k=k)[0]
+    return [{**store.get_metadata(index), "score": score} for index, score in results]
+
+
+def format_context(chunks: List[Dict[str, Any]]) -> str:
+    """
+    検索結果をシステムメッセージに埋め込むためのテキストに整形
+
+    引数:
+        chunks (List[Dict[str, Any]]): 検索結果
+
+    戻り値:
+        str: 整形されたコンテキスト
+    """
+    return "\n\n".join(f"[{chunk.get('source', '')}]\n{chunk['text']}" for chunk in chunks)
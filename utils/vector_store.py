@@ -0,0 +1,268 @@
+"""
+メモリマップ型ベクトルストア
+
+ディスク上のNumPy配列をメモリマップで読み込み、コサイン類似度による近傍検索を行う。
+
+ディレクトリ構成:
+    header.json  : 次元数・件数などのヘッダー情報
+    vectors.f32  : 正規化済みベクトル（float32、行優先）
+    meta.jsonl   : 各ベクトルのID・メタデータ（1行1レコード）
+    meta.idx     : meta.jsonl内の各行のバイトオフセット（uint64）
+"""
+from typing import Dict, List, Any, Optional, Tuple
+import json
+import os
+
+import numpy as np
+
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.jsonl"
+META_INDEX_FILE = "meta.idx"
+
+DTYPE = np.float32
+
+
+class VectorStore:
+    """
+    メモリマップ型のベクトルストア
+
+    ベクトルはゼロコピーで読み込まれ、追加時は既存ファイルの末尾に追記するため
+    全体を再構築する必要はありません。
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None):
+        """
+        初期化メソッド
+
+        引数:
+            path (str): ストアのディレクトリ
+            dim (Optional[int]): ベクトルの次元数（新規作成時は必須）
+        """
+        self.path = path
+        self._vectors: Optional[np.memmap] = None
+        self._offsets: Optional[np.memmap] = None
+        self._header_mtime = 0
+
+        header_path = os.path.join(path, HEADER_FILE)
+        if os.path.exists(header_path):
+            self._load_header()
+            if dim is not None and dim != self.dim:
+                raise ValueError(f"次元数が一致しません: ストア={self.dim}, 指定={dim}")
+        else:
+            if dim is None:
+                raise ValueError(f"ベクトルストアが存在しません: {path}")
+            os.makedirs(path, exist_ok=True)
+            self.dim = dim
+            self.count = 0
+            self.meta_bytes = 0
+            for name in (VECTORS_FILE, META_FILE, META_INDEX_FILE):
+                open(os.path.join(path, name), "ab").close()
+            self._write_header()
+
+        self._map()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _load_header(self) -> None:
+        """ヘッダーを読み込む"""
+        header_path = os.path.join(self.path, HEADER_FILE)
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self.dim = header["dim"]
+        self.count = header["count"]
+        self.meta_bytes = header["meta_bytes"]
+        self._header_mtime = os.stat(header_path).st_mtime_ns
+
+    def _write_header(self) -> None:
+        """ヘッダーをアトミックに書き込む"""
+        header_path = os.path.join(self.path, HEADER_FILE)
+        tmp_path = header_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"dim": self.dim, "count": self.count, "meta_bytes": self.meta_bytes, "dtype": "float32"},
+                f,
+            )
+        os.replace(tmp_path, header_path)
+        self._header_mtime = os.stat(header_path).st_mtime_ns
+
+    def _map(self) -> None:
+        """ベクトルとオフセットをメモリマップする（コピーは発生しない）"""
+        if self.count == 0:
+            self._vectors = np.empty((0, self.dim), dtype=DTYPE)
+            self._offsets = np.empty((0,), dtype=np.uint64)
+            return
+
+        self._vectors = np.memmap(
+            os.path.join(self.path, VECTORS_FILE),
+            dtype=DTYPE,
+            mode="r",
+            shape=(self.count, self.dim),
+        )
+        self._offsets = np.memmap(
+            os.path.join(self.path, META_INDEX_FILE),
+            dtype=np.uint64,
+            mode="r",
+            shape=(self.count,),
+        )
+
+    def refresh(self) -> bool:
+        """
+        別プロセスによる追加を検出し、必要であれば再マップする
+
+        戻り値:
+            bool: 再マップした場合はTrue
+        """
+        header_path = os.path.join(self.path, HEADER_FILE)
+        if os.stat(header_path).st_mtime_ns == self._header_mtime:
+            return False
+        self._load_header()
+        self._map()
+        return True
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """正規化済みベクトルの読み取り専用ビュー"""
+        return self._vectors
+
+    def add(self, vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> List[int]:
+        """
+        ベクトルとメタデータを追記する
+
+        引数:
+            vectors (np.ndarray): 形状 (n, dim) のベクトル
+            metadata (List[Dict[str, Any]]): 各ベクトルに対応するメタデータ
+
+        戻り値:
+            List[int]: 追加されたベクトルのID
+        """
+        vectors = np.asarray(vectors, dtype=DTYPE)
+        if vectors.ndim == 1:
+            vectors = vectors[np.newaxis, :]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"次元数が一致しません: ストア={self.dim}, 入力={vectors.shape[1]}")
+        if len(metadata) != len(vectors):
+            raise ValueError("ベクトルとメタデータの件数が一致しません")
+
+        vectors = normalize(vectors)
+        start = self.count
+        ids = list(range(start, start + len(vectors)))
+
+        with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+            f.truncate(start * self.dim * DTYPE().itemsize)
+            f.write(vectors.tobytes())
+
+        offsets = np.empty(len(metadata), dtype=np.uint64)
+        with open(os.path.join(self.path, META_FILE), "ab") as f:
+            f.truncate(self.meta_bytes)
+            position = self.meta_bytes
+            for i, (vector_id, meta) in enumerate(zip(ids, metadata)):
+                offsets[i] = position
+                line = (json.dumps({"id": vector_id, **meta}, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                position += len(line)
+
+        with open(os.path.join(self.path, META_INDEX_FILE), "ab") as f:
+            f.truncate(start * np.dtype(np.uint64).itemsize)
+            f.write(offsets.tobytes())
+
+        # ヘッダーを最後に更新することで、途中で失敗しても既存データは有効なまま
+        self.count += len(vectors)
+        self.meta_bytes = position
+        self._write_header()
+        self._map()
+
+        return ids
+
+    def get_metadata(self, index: int) -> Dict[str, Any]:
+        """
+        IDからメタデータを取得
+
+        引数:
+            index (int): ベクトルのID
+
+        戻り値:
+            Dict[str, Any]: メタデータ
+        """
+        if not 0 <= index < self.count:
+            raise IndexError(f"IDが範囲外です: {index}")
+        with open(os.path.join(self.path, META_FILE), "rb") as f:
+            f.seek(int(self._offsets[index]))
+            return json.loads(f.readline())
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 4,
+        block_size: int = 65536,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        コサイン類似度による上位k件の検索
+
+        複数のクエリをまとめて行列積で処理し、ストアをブロック単位で走査するため
+        件数が多い場合でもメモリ使用量は一定に保たれます。
+
+        引数:
+            queries (np.ndarray): 形状 (dim,) または (q, dim) のクエリベクトル
+            k (int): 返す件数
+            block_size (int): 一度に走査する行数
+
+        戻り値:
+            List[List[Tuple[int, float]]]: クエリごとの (ID, スコア) のリスト（スコア降順）
+        """
+        queries = np.asarray(queries, dtype=DTYPE)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        queries = normalize(queries)
+
+        num_queries = len(queries)
+        k = min(k, self.count)
+        if k <= 0:
+            return [[] for _ in range(num_queries)]
+
+        best_scores = np.full((num_queries, 0), -np.inf, dtype=DTYPE)
+        best_ids = np.empty((num_queries, 0), dtype=np.int64)
+        rows = np.arange(num_queries)[:, np.newaxis]
+
+        for start in range(0, self.count, block_size):
+            block = self._vectors[start:start + block_size]
+            scores = queries @ block.T
+
+            # ブロック内の上位k件を抽出し、これまでの上位候補と統合する
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(scores, -block_k, axis=1)[:, -block_k:]
+            candidate_scores = np.concatenate([best_scores, scores[rows, top]], axis=1)
+            candidate_ids = np.concatenate([best_ids, top + start], axis=1)
+
+            if candidate_scores.shape[1] > k:
+                keep = np.argpartition(candidate_scores, -k, axis=1)[:, -k:]
+                candidate_scores = candidate_scores[rows, keep]
+                candidate_ids = candidate_ids[rows, keep]
+            best_scores = candidate_scores
+            best_ids = candidate_ids
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = best_scores[rows, order]
+        best_ids = best_ids[rows, order]
+
+        return [
+            [(int(i), float(s)) for i, s in zip(ids, scores)]
+            for ids, scores in zip(best_ids, best_scores)
+        ]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    ベクトルをL2正規化する
+
+    引数:
+        vectors (np.ndarray): 形状 (n, dim) のベクトル
+
+    戻り値:
+        np.ndarray: 正規化されたベクトル
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(DTYPE, copy=False)